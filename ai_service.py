@@ -1,5 +1,25 @@
 import google.generativeai as genai
 import re
+import threading
+import time
+from collections import deque
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, TimeoutError as FutureTimeoutError
+import config
+import metrics
+import scheduler
+
+# Small stop-word lists used to spot a response written in the wrong language.
+LANGUAGE_STOPWORDS = {
+    "EN": {"the", "and", "with", "of", "to", "in", "for", "is", "my", "i", "a", "as", "on", "this"},
+    "DE": {"der", "die", "das", "und", "mit", "ich", "ist", "für", "von", "zu", "den", "ein", "eine", "im"},
+}
+
+# Recent latencies (in seconds) per prompt key, used to decide when to hedge a call.
+_latency_samples = {}
+_hedge_stats = {"calls": 0, "hedged": 0, "hedge_wins": 0, "estimated_seconds_saved": 0.0}
+_hedge_lock = threading.Lock()
+_hedge_executor = None
 
 def clean_ai_response(text):
     """
@@ -18,6 +38,100 @@ def clean_ai_response(text):
     
     return text.strip()
 
+def clean_partial_response(text):
+    """
+    Cleans a response that is still streaming in.
+    Only the leading junk is removed, since the end of the text is not final yet.
+    """
+    text = re.sub(r'^\s*```[a-zA-Z]*\n?', '', text)
+    text = re.sub(r'^[\[\{\s"\']+', '', text)
+    return text
+
+def detect_language_mismatch(text, lang):
+    """Returns True if the text looks like it was written in a different language than 'lang'."""
+    expected = LANGUAGE_STOPWORDS.get(lang)
+    if not expected:
+        return False
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < config.AI_LANGUAGE_CHECK_MIN_WORDS:
+        return False
+    expected_hits = sum(1 for word in words if word in expected)
+    for other_lang, stopwords in LANGUAGE_STOPWORDS.items():
+        if other_lang != lang and sum(1 for word in words if word in stopwords) > 2 * max(expected_hits, 1):
+            return True
+    return False
+
+def validate_partial_response(text, rules, lang=None):
+    """
+    Checks a (possibly partial) cleaned response against the output rules.
+    Returns a short description of the first broken rule, or None if the text is fine so far.
+    """
+    fence_pos = text.find("```")
+    if fence_pos != -1 and text[:fence_pos].strip() and text[fence_pos + 3:].strip():
+        return "code fence inside the response"
+    max_chars = rules.get("max_chars")
+    if max_chars and len(text.strip()) > max_chars:
+        return f"longer than {max_chars} characters"
+    max_lines = rules.get("max_lines")
+    if max_lines and len([line for line in text.split('\n') if line.strip()]) > max_lines:
+        return f"more than {max_lines} lines"
+    if rules.get("single_paragraph") and re.search(r'\S\s*\n\s*\n\s*\S', text):
+        return "more than one paragraph"
+    for pattern in rules.get("forbidden_patterns", []):
+        if re.search(pattern, text):
+            return f"forbidden pattern '{pattern}'"
+    if lang and detect_language_mismatch(text, lang):
+        return f"not written in {lang}"
+    return None
+
+def validate_response(prompt_key, text, lang=None):
+    """Checks a finished, cleaned response against the output rules of its prompt key. Returns the broken rule or None."""
+    return validate_partial_response(text, config.AI_OUTPUT_RULES.get(prompt_key, config.AI_DEFAULT_OUTPUT_RULES), lang)
+
+def _cancel_stream(response):
+    """Stops a streaming response so the remaining tokens are not generated."""
+    iterator = getattr(response, "_iterator", None)
+    cancel = getattr(iterator, "cancel", None)
+    if callable(cancel):
+        try:
+            cancel()
+        except Exception:
+            pass
+
+class _Cancellation:
+    """
+    Lets the thread waiting for a hedged call stop a request that runs in another thread.
+    A streaming request is cancelled at once; a non-streaming request that is already sent cannot be
+    stopped, so it runs to completion and its result is discarded (best effort).
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._response = None
+
+    def is_set(self):
+        return self._event.is_set()
+
+    def attach(self, response):
+        """Registers the streaming response of the running attempt, cancelling it if cancel() came first."""
+        with self._lock:
+            self._response = response
+            cancelled = self._event.is_set()
+        if cancelled:
+            _cancel_stream(response)
+
+    def detach(self):
+        with self._lock:
+            self._response = None
+
+    def cancel(self):
+        with self._lock:
+            self._event.set()
+            response = self._response
+        if response is not None:
+            _cancel_stream(response)
+
 def configure_ai():
     """Prompts for and configures the AI model."""
     try:
@@ -33,17 +147,244 @@ def configure_ai():
         print(f"Error configuring Google AI: {e}")
         return None
 
-def generate_content(model, system_instruction, template, context):
-    """Generates and cleans content from the AI using a structured prompt."""
+def generate_content(model, system_instruction, template, context, prompt_key=None, lang=None):
+    """
+    Generates and cleans content from the AI using a structured prompt.
+    If hedging is enabled and a prompt_key is given, slow calls are hedged with a duplicate request.
+    """
+    if config.AI_HEDGING_ENABLED and prompt_key:
+        return generate_content_hedged(model, system_instruction, template, context, prompt_key, lang)
+    if not prompt_key:
+        return _generate_once(model, system_instruction, template, context, prompt_key, lang)
+    return _timed_attempt(prompt_key, model, system_instruction, template, context, prompt_key, lang)[0]
+
+def _generate_once(model, system_instruction, template, context, prompt_key=None, lang=None, cancel_event=None, on_started=None):
+    """
+    Runs a single AI request, streaming it if streaming is enabled and a prompt_key is given.
+    on_started() is called once the request holds an AI slot and is sent.
+    A request cancelled through cancel_event before it got a slot is not sent and returns None.
+    """
+    if config.AI_STREAMING_ENABLED and prompt_key:
+        return generate_content_stream(model, system_instruction, template, context, prompt_key, lang, cancel_event, on_started)
+    start = time.monotonic()
     try:
         prompt = f"{system_instruction}\n\n{template.format(**context)}"
-        response = model.generate_content(prompt)
+        with scheduler.AI_BUDGET.slot():
+            if cancel_event and cancel_event.is_set():
+                return None
+            start = time.monotonic()
+            if on_started:
+                on_started()
+            response = model.generate_content(prompt)
         
         # --- THIS IS THE KEY ---
         # We immediately clean the raw response text.
         cleaned_text = clean_ai_response(response.text)
         
+        metrics.record_ai_call(prompt_key, time.monotonic() - start, *metrics.get_usage(response, prompt, response.text))
         return cleaned_text
     except Exception as e:
         print(f"An error occurred while generating AI content: {e}")
+        metrics.record_ai_call(prompt_key, time.monotonic() - start, 0, 0, "error")
+        return None
+
+def record_latency(prompt_key, seconds):
+    """Stores a latency sample for a prompt key."""
+    with _hedge_lock:
+        samples = _latency_samples.setdefault(prompt_key, deque(maxlen=200))
+        samples.append(seconds)
+
+def get_latency_percentile(prompt_key, percentile):
+    """Returns the given latency percentile for a prompt key, or None if there are too few samples."""
+    with _hedge_lock:
+        samples = sorted(_latency_samples.get(prompt_key, ()))
+    if len(samples) < config.AI_HEDGE_MIN_SAMPLES:
+        return None
+    index = min(len(samples) - 1, int(round(percentile / 100 * (len(samples) - 1))))
+    return samples[index]
+
+def _estimate_tail_latency(prompt_key, threshold):
+    """Average latency of the samples slower than the threshold, i.e. what a slow call usually costs."""
+    with _hedge_lock:
+        tail = [sample for sample in _latency_samples.get(prompt_key, ()) if sample > threshold]
+    return sum(tail) / len(tail) if tail else threshold
+
+def _reserve_hedge():
+    """Claims one extra request from the hedging budget. Returns False if the budget is used up."""
+    with _hedge_lock:
+        if _hedge_stats["hedged"] + 1 > config.AI_HEDGE_MAX_EXTRA_FRACTION * _hedge_stats["calls"]:
+            return False
+        _hedge_stats["hedged"] += 1
+        return True
+
+def _get_hedge_executor():
+    global _hedge_executor
+    with _hedge_lock:
+        if _hedge_executor is None:
+            # Every parallel job can have one primary and one hedged request in flight.
+            _hedge_executor = ThreadPoolExecutor(max_workers=2 * config.MAX_PARALLEL_JOBS, thread_name_prefix="ai-hedge")
+        return _hedge_executor
+
+def _timed_attempt(prompt_key, *args, cancel_event=None, started=None):
+    """
+    Runs one request and returns (result, seconds).
+    Time spent waiting for an AI slot is not counted; 'started' is set once the request is sent.
+    Cancelled requests still record how long they ran, unless they never got to run.
+    """
+    started_at = []
+
+    def mark_started():
+        if not started_at:
+            started_at.append(time.monotonic())
+            if started:
+                started.set()
+
+    result = _generate_once(*args, cancel_event=cancel_event, on_started=mark_started)
+    if not started_at:
+        return result, 0.0
+    elapsed = time.monotonic() - started_at[0]
+    if result is not None or (cancel_event and cancel_event.is_set()):
+        record_latency(prompt_key, elapsed)
+    return result, elapsed
+
+def generate_content_hedged(model, system_instruction, template, context, prompt_key, lang=None):
+    """
+    Generates content with a hedged request.
+    - If the call has not returned within the observed latency percentile for its prompt key,
+      counted from when it was actually sent, a duplicate request is sent
+      (within the config.AI_HEDGE_MAX_EXTRA_FRACTION budget).
+    - The first successful result is used and the other request is cancelled (see _Cancellation).
+    """
+    with _hedge_lock:
+        _hedge_stats["calls"] += 1
+    executor = _get_hedge_executor()
+    request_args = (model, system_instruction, template, context, prompt_key, lang)
+
+    primary_cancel = _Cancellation()
+    primary_started = threading.Event()
+    primary = executor.submit(contextvars.copy_context().run, _timed_attempt, prompt_key, *request_args,
+                              cancel_event=primary_cancel, started=primary_started)
+    threshold = get_latency_percentile(prompt_key, config.AI_HEDGE_PERCENTILE)
+    if threshold is None:
+        return primary.result()[0]
+    # Only a request that is actually running can be slow; time spent queued for a slot does not count.
+    primary.add_done_callback(lambda future: primary_started.set())
+    primary_started.wait()
+    start = time.monotonic()
+    try:
+        return primary.result(timeout=max(0.0, threshold - (time.monotonic() - start)))[0]
+    except FutureTimeoutError:
+        pass
+    if not _reserve_hedge():
+        return primary.result()[0]
+
+    print(f"AI call for '{prompt_key}' is slower than {threshold:.1f}s. Sending a hedged request...")
+    hedge_cancel = _Cancellation()
+    hedge = executor.submit(contextvars.copy_context().run, _timed_attempt, prompt_key, *request_args, cancel_event=hedge_cancel)
+    pending = {primary: primary_cancel, hedge: hedge_cancel}
+    result = None
+    while pending and result is None:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            pending.pop(future)
+            if result is None:
+                result = future.result()[0]
+                winner = future
+
+    for cancel_event in pending.values():
+        cancel_event.cancel()
+    if result is not None and winner is hedge:
+        seconds_saved = max(0.0, _estimate_tail_latency(prompt_key, threshold) - (time.monotonic() - start))
+        with _hedge_lock:
+            _hedge_stats["hedge_wins"] += 1
+            _hedge_stats["estimated_seconds_saved"] += seconds_saved
+    return result
+
+def get_hedge_stats():
+    """Returns a copy of the hedging statistics for this run."""
+    with _hedge_lock:
+        return dict(_hedge_stats)
+
+def print_hedge_stats():
+    """Prints how often hedging fired and how much latency it saved."""
+    stats = get_hedge_stats()
+    if not config.AI_HEDGING_ENABLED or not stats["calls"]:
+        return
+    print(f"Hedged AI requests: {stats['hedged']} of {stats['calls']} calls "
+          f"({stats['hedge_wins']} won by the hedge, ~{stats['estimated_seconds_saved']:.1f}s saved).")
+
+def _read_stream(model, prompt, rules, lang, enforce_rules, cancel_event, on_started=None):
+    """
+    Sends one streaming request and reads it until it ends, breaks a rule or is cancelled.
+    Returns (response, raw text, violation, cancelled, seconds); response is None if it was cancelled before it was sent.
+    """
+    with scheduler.AI_BUDGET.slot():
+        if cancel_event and cancel_event.is_set():
+            return None, "", None, True, 0.0
+        start = time.monotonic()
+        if on_started:
+            on_started()
+        response = model.generate_content(prompt, stream=True)
+        if cancel_event:
+            cancel_event.attach(response)
+        raw_text = ""
+        try:
+            for chunk in response:
+                if cancel_event and cancel_event.is_set():
+                    _cancel_stream(response)
+                    return response, raw_text, None, True, time.monotonic() - start
+                raw_text += chunk.text
+                if enforce_rules:
+                    violation = validate_partial_response(clean_partial_response(raw_text), rules, lang)
+                    if violation:
+                        _cancel_stream(response)
+                        return response, raw_text, violation, False, time.monotonic() - start
+        except Exception:
+            # Cancelling from another thread makes the stream raise in this one.
+            if cancel_event and cancel_event.is_set():
+                return response, raw_text, None, True, time.monotonic() - start
+            raise
+        finally:
+            if cancel_event:
+                cancel_event.detach()
+        return response, raw_text, None, False, time.monotonic() - start
+
+def generate_content_stream(model, system_instruction, template, context, prompt_key, lang=None, cancel_event=None, on_started=None):
+    """
+    Streams content from the AI and validates it chunk by chunk.
+    - As soon as the output breaks a rule from config.AI_OUTPUT_RULES, the stream is cancelled and retried.
+    - The last attempt is never cancelled, so a result is always returned if the API answers.
+    - Cancelling cancel_event (a _Cancellation) stops the stream, even between chunks, and returns None.
+    - on_started() is called whenever an attempt holds an AI slot and is sent.
+    """
+    rules = config.AI_OUTPUT_RULES.get(prompt_key, config.AI_DEFAULT_OUTPUT_RULES)
+    max_attempts = config.AI_STREAM_MAX_RETRIES + 1
+    try:
+        prompt = f"{system_instruction}\n\n{template.format(**context)}"
+        for attempt in range(max_attempts):
+            enforce_rules = attempt < max_attempts - 1
+            response, raw_text, violation, cancelled, seconds = _read_stream(model, prompt, rules, lang, enforce_rules, cancel_event, on_started)
+            if cancelled and response is None:
+                return None
+            usage = metrics.get_usage(response, prompt, raw_text)
+            if cancelled:
+                metrics.record_ai_call(prompt_key, seconds, *usage, "cancelled")
+                return None
+            if violation:
+                metrics.record_ai_call(prompt_key, seconds, *usage, "cancelled")
+                print(f"Cancelled AI response for '{prompt_key}' (attempt {attempt+1} of {max_attempts}): {violation}. Retrying...")
+                continue
+
+            cleaned_text = clean_ai_response(raw_text)
+            if enforce_rules:
+                violation = validate_partial_response(cleaned_text, rules, lang)
+            metrics.record_ai_call(prompt_key, seconds, *usage, "cancelled" if violation else "ok")
+            if violation:
+                print(f"Rejected AI response for '{prompt_key}' (attempt {attempt+1} of {max_attempts}): {violation}. Retrying...")
+                continue
+            return cleaned_text
+        return None
+    except Exception as e:
+        print(f"An error occurred while generating AI content: {e}")
+        metrics.record_ai_call(prompt_key, 0.0, 0, 0, "error")
         return None
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import config
+
+# One lock per application folder, so parallel builds do not lose each other's manifest entries.
+_manifest_locks = {}
+_manifest_locks_guard = threading.Lock()
+
+def _manifest_lock(app_dir):
+    with _manifest_locks_guard:
+        return _manifest_locks.setdefault(os.path.abspath(app_dir), threading.Lock())
+
+def _blob_path(digest):
+    return os.path.join(config.ARTIFACT_STORE_DIR, "blobs", digest[:2], digest)
+
+def hash_file(path):
+    """Returns the SHA-256 hex digest of a file's content."""
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+def put_file(path, keep_source=False):
+    """
+    Adds a file to the store and returns its digest.
+    The source is moved into the store unless keep_source is set; if the same content
+    is already stored, the source is simply dropped.
+    """
+    digest = hash_file(path)
+    blob_path = _blob_path(digest)
+    if os.path.exists(blob_path):
+        if not keep_source:
+            os.remove(path)
+        os.utime(blob_path)  # Restart the garbage collection grace period
+        return digest
+    os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+    temp_path = f"{blob_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    if keep_source:
+        shutil.copy2(path, temp_path)
+    else:
+        shutil.move(path, temp_path)
+    os.replace(temp_path, blob_path)
+    os.utime(blob_path)
+    return digest
+
+def link_file(digest, dest_path):
+    """Places a stored blob at dest_path as a hardlink, falling back to a copy across filesystems."""
+    if os.path.lexists(dest_path):
+        os.remove(dest_path)
+    try:
+        os.link(_blob_path(digest), dest_path)
+    except OSError:
+        shutil.copy2(_blob_path(digest), dest_path)
+
+def store_output(path):
+    """Moves a generated file into the store and links it back to the same path. Returns its digest."""
+    digest = put_file(path)
+    link_file(digest, path)
+    return digest
+
+def write_manifest(app_dir, outputs, sources=None):
+    """
+    Writes the manifest of an application folder.
+    'outputs' maps file names in the folder to digests, 'sources' maps intermediate files to digests.
+    Existing entries are kept so that several runs can add to the same folder.
+    """
+    manifest_path = os.path.join(app_dir, config.ARTIFACT_MANIFEST_FILE)
+    with _manifest_lock(app_dir):
+        manifest = read_manifest(app_dir) or {"outputs": {}, "sources": {}}
+        manifest["outputs"].update(outputs)
+        manifest["sources"].update(sources or {})
+        temp_path = f"{manifest_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(temp_path, manifest_path)
+
+def read_manifest(app_dir):
+    """Returns the manifest of an application folder, or None if it has none."""
+    try:
+        with open(os.path.join(app_dir, config.ARTIFACT_MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _source_files(directory, extensions):
+    """Yields (relative path, path) of every source file with one of the extensions in a build directory."""
+    for dirpath, _, filenames in os.walk(directory):
+        for filename in filenames:
+            if filename.endswith(extensions):
+                file_path = os.path.join(dirpath, filename)
+                yield os.path.relpath(file_path, directory), file_path
+
+def hash_sources(directory, extensions=(".tex",)):
+    """Returns {relative path: digest} of the source files in a build directory without storing them."""
+    return {key: hash_file(file_path) for key, file_path in _source_files(directory, extensions)}
+
+def store_sources(directory, extensions=(".tex",), prefix=""):
+    """
+    Stores the intermediate source files of a build directory. Returns {relative path: digest}.
+    A prefix (e.g. the variant name) keeps the sources of several builds in one folder apart.
+    """
+    return {f"{prefix}/{key}" if prefix else key: put_file(file_path, keep_source=True)
+            for key, file_path in _source_files(directory, extensions)}
+
+def _referenced_digests():
+    """Collects every digest referenced by a manifest under the applications directory."""
+    referenced = set()
+    if not os.path.isdir(config.APPLICATIONS_DIR):
+        return referenced
+    for entry in os.scandir(config.APPLICATIONS_DIR):
+        if entry.is_dir() and not entry.name.startswith(('.', '_')):
+            manifest = read_manifest(entry.path)
+            if manifest:
+                referenced.update(manifest.get("outputs", {}).values())
+                referenced.update(manifest.get("sources", {}).values())
+    return referenced
+
+def collect_garbage():
+    """
+    Removes orphaned temporary build trees and blobs that no manifest references any more.
+    Returns (removed temp trees, removed blobs, bytes freed).
+    """
+    now = time.time()
+    removed_trees, removed_blobs, freed_bytes = 0, 0, 0
+
+    if os.path.isdir(config.APPLICATIONS_DIR):
+        max_age = config.ARTIFACT_GC_TEMP_MAX_AGE_HOURS * 3600
+        for entry in os.scandir(config.APPLICATIONS_DIR):
+            if entry.is_dir() and entry.name.startswith('_') and entry.name.endswith('_temp'):
+                if now - entry.stat().st_mtime > max_age:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                    removed_trees += 1
+
+    blob_root = os.path.join(config.ARTIFACT_STORE_DIR, "blobs")
+    if os.path.isdir(blob_root):
+        referenced = _referenced_digests()
+        grace = config.ARTIFACT_GC_BLOB_GRACE_HOURS * 3600
+        for dirpath, _, filenames in os.walk(blob_root):
+            for filename in filenames:
+                blob_path = os.path.join(dirpath, filename)
+                stat = os.stat(blob_path)
+                if filename not in referenced and now - stat.st_mtime > grace:
+                    os.remove(blob_path)
+                    removed_blobs += 1
+                    freed_bytes += stat.st_size
+
+    if removed_trees or removed_blobs:
+        print(f"Garbage collection: removed {removed_trees} temporary build folders and {removed_blobs} unreferenced files ({freed_bytes / 1024 / 1024:.1f} MB).")
+    return removed_trees, removed_blobs, freed_bytes
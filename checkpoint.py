@@ -0,0 +1,81 @@
+import datetime
+import hashlib
+import json
+import os
+import config
+
+# Pipeline stages in the order they run.
+STAGE_AI_GENERATION = "ai_generation"
+STAGE_TEMPLATE_RENDER = "template_render"
+STAGE_CV_COMPILE = "cv_compile"
+STAGE_COVER_LETTER_COMPILE = "cover_letter_compile"
+STAGE_STATUS_COMMIT = "status_commit"
+STAGES = [STAGE_AI_GENERATION, STAGE_TEMPLATE_RENDER, STAGE_CV_COMPILE, STAGE_COVER_LETTER_COMPILE, STAGE_STATUS_COMMIT]
+
+def get_job_id(job_info):
+    """A stable ID for a job row, based on the fields that determine its output."""
+    parts = [job_info.get(field, "") or "" for field in ("CompanyName", "JobTitle", "Language", "JobDescription")]
+    return hashlib.sha256("\x00".join(parts).encode('utf-8')).hexdigest()[:20]
+
+def hash_inputs(my_profile, prompts):
+    """
+    Identifies the profile and prompts a job's AI content was generated from.
+    Stored with the AI stage, so editing either file regenerates the content instead of reusing it.
+    """
+    parts = [my_profile, json.dumps(prompts, sort_keys=True, ensure_ascii=False)]
+    return hashlib.sha256("\x00".join(parts).encode('utf-8')).hexdigest()[:20]
+
+class JobJournal:
+    """
+    A per-job journal of finished pipeline stages and their outputs.
+    CV template variants get a journal of their own for the render and CV compile stages.
+    Every update is written to disk atomically, so a crash never leaves a half-written journal.
+    """
+
+    def __init__(self, job_info, variant=""):
+        self.job_id = get_job_id(job_info) + (f"-{variant}" if variant else "")
+        self.path = os.path.join(config.CHECKPOINT_DIR, f"{self.job_id}.json")
+        self.data = {"job": f"{job_info.get('JobTitle', '')} at {job_info.get('CompanyName', '')}", "stages": {}}
+        if config.CHECKPOINT_ENABLED and os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.data = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Warning: Could not read checkpoint journal '{self.path}': {e}. Starting from scratch.")
+
+    def get(self, stage):
+        """Returns the outputs of a finished stage, or None if the stage has not finished."""
+        entry = self.data["stages"].get(stage)
+        return entry["outputs"] if entry else None
+
+    def last_finished_stage(self):
+        """Returns the name of the last finished stage, or None."""
+        finished = [stage for stage in STAGES if stage in self.data["stages"]]
+        return finished[-1] if finished else None
+
+    def complete(self, stage, outputs=None):
+        """Records a finished stage and its outputs."""
+        self.data["stages"][stage] = {"completed_at": datetime.datetime.now().isoformat(timespec="seconds"), "outputs": outputs or {}}
+        self._save()
+
+    def invalidate_from(self, stage):
+        """Forgets a stage and every stage after it, e.g. when its outputs have gone missing."""
+        for later_stage in STAGES[STAGES.index(stage):]:
+            self.data["stages"].pop(later_stage, None)
+        self._save()
+
+    def discard(self):
+        """Deletes the journal once the job has been committed."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _save(self):
+        if not config.CHECKPOINT_ENABLED:
+            return
+        os.makedirs(config.CHECKPOINT_DIR, exist_ok=True)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
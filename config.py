@@ -43,3 +43,108 @@ PROFILE_SUMMARY_PLACEHOLDER = "[---PROFILE-SUMMARY-PLACEHOLDER---]"
 EXPERIENCE_BLOCK_JUNIOR_DEV_PLACEHOLDER = "---EXPERIENCE-BLOCK-JUNIOR-DEV---"
 EXPERIENCE_BLOCK_INTERNSHIP_DEV_PLACEHOLDER = "---EXPERIENCE-BLOCK-INTERNSHIP-DEV---"
 EXPERIENCE_BLOCK_FULLSTACK_DEV_PLACEHOLDER = "---EXPERIENCE-BLOCK-FULLSTACK-DEV---"
+
+# --- AI Streaming Configuration ---
+# When enabled, responses are streamed and checked chunk by chunk so that a broken
+# response can be cancelled and retried before it has been generated in full.
+AI_STREAMING_ENABLED = True
+AI_STREAM_MAX_RETRIES = 2  # Early-cancelled attempts before the last attempt is accepted as-is
+AI_LANGUAGE_CHECK_MIN_WORDS = 25  # Words needed before the output language is judged
+
+# Rules for each prompt key. Supported rules:
+#   max_chars, max_lines, single_paragraph, forbidden_patterns (list of regexes)
+AI_DEFAULT_OUTPUT_RULES = {
+    "max_chars": 1500,
+    "single_paragraph": True,
+    "forbidden_patterns": [r"\[[A-Z][A-Za-z ]+\]"],  # Placeholders like [Job Title]
+}
+AI_OUTPUT_RULES = {
+    "profile_summary": {
+        "max_chars": 1200,
+        "single_paragraph": True,
+        "forbidden_patterns": [r"\[[A-Z][A-Za-z ]+\]"],
+    },
+    "experience_block": {
+        "max_chars": 2000,
+        "max_lines": 8,
+        "forbidden_patterns": [r"\\item", r"\\begin", r"(?m)^\s*[-*•]\s"],
+    },
+}
+
+# --- AI Hedging Configuration ---
+# When enabled, an AI call that is still running after the observed latency percentile
+# for its prompt type gets a duplicate request; the first result wins and the other is cancelled.
+AI_HEDGING_ENABLED = False
+AI_HEDGE_PERCENTILE = 95
+AI_HEDGE_MIN_SAMPLES = 10  # Latency samples needed per prompt type before hedging kicks in
+AI_HEDGE_MAX_EXTRA_FRACTION = 0.1  # At most this fraction of calls may send an extra request
+
+# --- Semantic Reuse of Experience Blocks ---
+# Rewritten experience blocks are stored together with a hashed n-gram vector of the job
+# description. A new job whose description is similar enough reuses the stored block.
+SEMANTIC_CACHE_ENABLED = True
+SEMANTIC_CACHE_FILE = os.path.join(APPLICATIONS_DIR, ".semantic_cache.jsonl")  # Append-only, compacted on load
+SEMANTIC_SIMILARITY_THRESHOLD = 0.9  # Cosine similarity (0-1) needed to reuse a stored block
+SEMANTIC_VECTOR_DIMENSIONS = 2 ** 16
+SEMANTIC_CACHE_MAX_ENTRIES_PER_BLOCK = 200
+
+# --- Metrics Configuration ---
+# Prices in USD per million tokens, used for the cost estimate in the run summary.
+AI_PRICE_PER_MILLION_INPUT_TOKENS = 0.30
+AI_PRICE_PER_MILLION_OUTPUT_TOKENS = 2.50
+# Set to a port number (e.g. 9464) to expose Prometheus-style metrics on http://127.0.0.1:<port>/metrics
+METRICS_PORT = None
+METRICS_HOST = "127.0.0.1"
+METRICS_LATENCY_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)  # seconds
+
+# --- Artifact Store Configuration ---
+# Generated PDFs and .tex sources are kept once by content hash; the per-application
+# folders hold hardlinks to them plus a manifest.
+ARTIFACT_STORE_ENABLED = True  # Also makes xelatex/pandoc output reproducible, so identical builds share one PDF blob
+ARTIFACT_STORE_DIR = os.path.join(APPLICATIONS_DIR, ".store")
+ARTIFACT_MANIFEST_FILE = "manifest.json"
+ARTIFACT_GC_TEMP_MAX_AGE_HOURS = 24  # Failed build trees older than this are removed
+ARTIFACT_GC_BLOB_GRACE_HOURS = 1  # Unreferenced blobs younger than this are kept (a run may still be linking them)
+
+# --- Checkpoint Configuration ---
+# Each job's pipeline stages are journaled here so that a rerun resumes from the last finished stage.
+CHECKPOINT_ENABLED = True
+CHECKPOINT_DIR = os.path.join(APPLICATIONS_DIR, ".journal")
+
+# --- Watch Mode Configuration ---
+# In watch mode (python main.py --watch), jobs.csv is watched for appended rows.
+WATCH_POLL_INTERVAL = 5  # seconds; used when inotify is not available
+WATCH_DEBOUNCE_SECONDS = 1.0  # Wait this long after a change so a writer can finish its rows
+WATCH_MAX_ATTEMPTS = 3  # A row that fails this many times is skipped until the watcher is restarted
+
+# --- Scheduler Configuration ---
+# Jobs are ordered by the optional 'Priority' (1 = most important) and 'Deadline' (YYYY-MM-DD
+# or DD.MM.YYYY) columns, then by CSV order. AI calls and compiles get separate resource budgets.
+AI_MAX_CONCURRENT_REQUESTS = 4
+AI_REQUESTS_PER_MINUTE = 60  # Set to None to disable the rate limit
+COMPILE_WORKERS = os.cpu_count() or 2  # xelatex/pandoc runs in parallel, one per core
+# Jobs run one by one by default, so their console output stays readable. Raise this (or pass --jobs N)
+# to overlap jobs; AI_MAX_CONCURRENT_REQUESTS + COMPILE_WORKERS keeps both budgets busy.
+MAX_PARALLEL_JOBS = 1
+
+# --- Planner Configuration ---
+# Measured stage latencies are kept here between runs; 'python main.py --plan' uses them to project wall time.
+LATENCY_HISTORY_FILE = os.path.join(APPLICATIONS_DIR, ".stage_latencies.json")
+# Latencies (seconds) assumed for stages that have never been measured
+PLAN_DEFAULT_LATENCIES = {"ai": 8.0, "compile": 15.0, "pandoc": 5.0}
+
+# --- Scratch Workspace Configuration ---
+# Per-job LaTeX build trees live here instead of next to the final outputs. None picks
+# /dev/shm (RAM-backed) when available, otherwise the system temp directory.
+SCRATCH_ROOT = None
+SCRATCH_MAX_BYTES = 512 * 1024 * 1024  # Build trees beyond this size go to SCRATCH_FALLBACK_DIR instead
+SCRATCH_FALLBACK_DIR = os.path.join(APPLICATIONS_DIR, ".scratch")
+# Failed builds are copied here for debugging; only the newest FAILED_BUILDS_MAX are kept.
+FAILED_BUILDS_DIR = os.path.join(APPLICATIONS_DIR, "_failed_builds")
+FAILED_BUILDS_MAX = 5
+
+# --- Variant Configuration ---
+# A job can produce several applications, e.g. "EN,DE" or "EN,EN:cv_project_modern".
+# Each entry is LANGUAGE[:template directory inside TEMPLATES_DIR]. The optional 'Variants'
+# CSV column overrides this per row; None means one application in the row's 'Language'.
+DEFAULT_VARIANTS = None
@@ -0,0 +1,179 @@
+import csv
+import ctypes
+import ctypes.util
+import io
+import os
+import select
+import struct
+import time
+import config
+import file_utils
+
+# inotify event masks (see <sys/inotify.h>)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+_EVENT_HEADER = struct.Struct("iIII")
+
+# Bytes before the read offset that are remembered to detect a rewritten file.
+_FINGERPRINT_SIZE = 256
+
+def _find_record_ends(data):
+    """Returns the byte positions just after every CSV record end (newlines outside quoted fields)."""
+    ends = []
+    in_quotes = False
+    for position, byte in enumerate(data):
+        if byte == 0x22:  # "
+            in_quotes = not in_quotes
+        elif byte == 0x0A and not in_quotes:  # \n
+            ends.append(position + 1)
+    return ends
+
+class CsvTailReader:
+    """
+    Reads rows appended to a CSV file since the last call, without re-reading the whole file.
+    If the file was rewritten in place (e.g. by a status update), the reader skips the rows it has
+    already seen and continues from there.
+    """
+
+    def __init__(self, csv_file):
+        self.csv_file = csv_file
+        self.header = None
+        self.offset = 0
+        self.rows_consumed = 0
+        self.fingerprint = b""
+
+    def read_new_rows(self):
+        """Returns the complete rows appended since the last call, as dicts."""
+        try:
+            with open(self.csv_file, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                if not self._offset_still_valid(f, size):
+                    self._resync(f)
+                f.seek(self.offset)
+                data = f.read()
+
+                record_ends = _find_record_ends(data)
+                if not record_ends:
+                    return []
+                complete = data[:record_ends[-1]]
+                self.offset += len(complete)
+                self._remember_fingerprint(f)
+        except FileNotFoundError:
+            return []
+
+        records = list(csv.reader(io.StringIO(complete.decode('utf-8'), newline='')))
+        if self.header is None and records:
+            self.header, records = records[0], records[1:]
+        self.rows_consumed += len(records)
+        return [dict(zip(self.header, record)) for record in records if record]
+
+    def _offset_still_valid(self, f, size):
+        if size < self.offset:
+            return False
+        if not self.fingerprint:
+            return True
+        f.seek(self.offset - len(self.fingerprint))
+        return f.read(len(self.fingerprint)) == self.fingerprint
+
+    def _remember_fingerprint(self, f):
+        start = max(0, self.offset - _FINGERPRINT_SIZE)
+        f.seek(start)
+        self.fingerprint = f.read(self.offset - start)
+
+    def _resync(self, f):
+        """Finds the offset after the header and the rows already consumed in a rewritten file."""
+        f.seek(0)
+        record_ends = _find_record_ends(f.read())
+        records_to_skip = (1 if self.header is not None else 0) + self.rows_consumed
+        if records_to_skip == 0:
+            self.offset = 0
+        elif records_to_skip <= len(record_ends):
+            self.offset = record_ends[records_to_skip - 1]
+        else:
+            # The file shrank below what we have seen; start over and let the caller filter duplicates.
+            self.header, self.offset, self.rows_consumed = None, 0, 0
+        self.fingerprint = b""
+
+def _open_inotify(csv_file):
+    """Watches the directory of the CSV file with inotify. Returns a file descriptor, or None if unavailable."""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            return None
+        directory = os.path.dirname(os.path.abspath(csv_file))
+        if libc.inotify_add_watch(fd, directory.encode(), IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE) < 0:
+            os.close(fd)
+            return None
+        return fd
+    except (OSError, AttributeError):
+        return None
+
+def _drain_events(fd, filename):
+    """Reads all pending inotify events and returns True if any of them concern the given file."""
+    touched = False
+    while True:
+        try:
+            data = os.read(fd, 65536)
+        except BlockingIOError:
+            return touched
+        position = 0
+        while position + _EVENT_HEADER.size <= len(data):
+            _, _, _, name_length = _EVENT_HEADER.unpack_from(data, position)
+            name = data[position + _EVENT_HEADER.size:position + _EVENT_HEADER.size + name_length].rstrip(b"\0")
+            touched = touched or name.decode(errors='ignore') == filename
+            position += _EVENT_HEADER.size + name_length
+
+class CsvWatcher:
+    """Blocks until a CSV file changes, using inotify where available and polling otherwise."""
+
+    def __init__(self, csv_file):
+        self.csv_file = csv_file
+        self.filename = os.path.basename(csv_file)
+        self.fd = _open_inotify(csv_file)
+        self.last_state = self._file_state()
+        print(f"Watching '{csv_file}' for new rows ({'inotify' if self.fd is not None else 'polling'}).")
+
+    def _file_state(self):
+        try:
+            stat = os.stat(self.csv_file)
+            return stat.st_mtime_ns, stat.st_size
+        except FileNotFoundError:
+            return None
+
+    def wait_for_change(self):
+        """
+        Returns once the file has changed and has not been written to for the debounce period.
+        Status updates written by this process itself (see file_utils.update_csv_status) are ignored.
+        """
+        while True:
+            self._wait_for_event()
+            # Let the writer finish appending before the new rows are read.
+            while True:
+                state = self._file_state()
+                time.sleep(config.WATCH_DEBOUNCE_SECONDS)
+                if self._file_state() == state:
+                    break
+            if self.fd is not None:
+                _drain_events(self.fd, self.filename)
+            previous_state, self.last_state = self.last_state, self._file_state()
+            if not file_utils.is_own_write(self.csv_file, previous_state, self.last_state):
+                return
+
+    def _wait_for_event(self):
+        while True:
+            if self.fd is not None:
+                readable, _, _ = select.select([self.fd], [], [], config.WATCH_POLL_INTERVAL)
+                changed = bool(readable) and _drain_events(self.fd, self.filename)
+            else:
+                time.sleep(config.WATCH_POLL_INTERVAL)
+                changed = self._file_state() != self.last_state
+            if changed:
+                return
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
@@ -1,7 +1,22 @@
 import csv
+import io
 import json
 import os
 import re
+import shutil
+import threading
+import config
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None
+
+# Serialises read-modify-write updates of the CSV when jobs run in parallel.
+_csv_lock = threading.Lock()
+# (CSV path, (mtime_ns, size) before) -> (mtime_ns, size) after, for every rewrite by this process.
+# Lets the watcher tell our own status updates apart from rows appended by someone else.
+_own_writes = {}
 
 def sanitize_for_latex(text):
     """
@@ -42,11 +57,29 @@ def get_all_pending_jobs(csv_file):
         return []
     return pending_jobs
 
+def get_csv_lock_path(csv_file):
+    """The lock file for a CSV. It lives in the applications folder, next to the other run state."""
+    return os.path.join(config.APPLICATIONS_DIR, f".{os.path.basename(csv_file)}.lock")
+
 def update_csv_status(csv_file, company_name, job_title, new_status):
-    """Updates the status for a specific company in the CSV file."""
+    """
+    Updates the status for a specific company in the CSV file.
+    The file is replaced atomically, and rows appended while the update runs are carried over.
+    Other programs appending rows can hold an exclusive flock on get_csv_lock_path(csv_file) to be fully safe.
+    """
+    lock_path = get_csv_lock_path(csv_file)
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    with _csv_lock, open(lock_path, 'a') as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        _update_csv_status(csv_file, company_name, job_title, new_status)
+
+def _update_csv_status(csv_file, company_name, job_title, new_status):
     try:
-        with open(csv_file, 'r', newline='', encoding='utf-8') as f:
-            lines = list(csv.reader(f))
+        with open(csv_file, 'rb') as f:
+            data = f.read()
+            before = os.fstat(f.fileno())
+        lines = list(csv.reader(io.StringIO(data.decode('utf-8'), newline='')))
         
         header = lines[0]
         # Get the index for each column we need to check/update
@@ -62,12 +95,39 @@ def update_csv_status(csv_file, company_name, job_title, new_status):
                 lines[i][status_idx] = new_status
                 break # We found the unique row, so we can stop searching
         
-        with open(csv_file, 'w', newline='', encoding='utf-8') as f:
-            csv.writer(f).writerows(lines)
+        output = io.StringIO(newline='')
+        csv.writer(output).writerows(lines)
+        temp_path = f"{csv_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(output.getvalue().encode('utf-8'))
+            # Re-read just before the replace, so rows appended in the meantime are not lost.
+            with open(csv_file, 'rb') as current:
+                current.seek(len(data))
+                appended = current.read()
+            f.write(appended)
+            f.flush()
+            stat = os.fstat(f.fileno())
+        shutil.copymode(csv_file, temp_path)
+        os.replace(temp_path, csv_file)
+        # A rewrite that carried over someone else's new rows is still a change worth reacting to.
+        if not appended:
+            _own_writes[(os.path.abspath(csv_file), (before.st_mtime_ns, before.st_size))] = (stat.st_mtime_ns, stat.st_size)
         print(f"Updated status for '{job_title}' at '{company_name}' to '{new_status}'.")
     except (FileNotFoundError, ValueError, IndexError) as e:
         print(f"An error occurred while updating the CSV: {e}")
 
+def is_own_write(csv_file, old_state, new_state):
+    """
+    Returns True if the CSV went from old_state to new_state ((mtime_ns, size) pairs) only through
+    status updates made by this process.
+    """
+    path = os.path.abspath(csv_file)
+    with _csv_lock:
+        state = old_state
+        while (path, state) in _own_writes:
+            state = _own_writes.pop((path, state))
+    return state == new_state and state != old_state
+
 def load_text_file(filepath):
     """Loads the content of a text file."""
     try:
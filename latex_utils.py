@@ -1,7 +1,15 @@
+import hashlib
+import json
 import os
 import shutil
 import subprocess
+import time
+import artifact_store
 import config
+import metrics
+import scheduler
+
+SOURCE_DATE_BASE = 1577836800  # 2020-01-01; reproducible PDFs get a creation date shortly after this
 
 def check_dependencies():
     # ... (this function remains the same) ...
@@ -17,16 +25,36 @@ def check_dependencies():
     return all_found
 
 def compile_to_pdf(directory):
-    # ... (this function remains the same) ...
+    """Compiles the main .tex file in a directory and records how long it took."""
+    with scheduler.CPU_BUDGET.slot():
+        start = time.monotonic()
+        success = _run_latex_compiler(directory)
+    metrics.record_stage("compile", time.monotonic() - start, success)
+    return success
+
+def _reproducible_env(*inputs):
+    """
+    Environment for a xelatex or pandoc run in which identical inputs give a byte-identical PDF,
+    so the artifact store can deduplicate it. The creation date and document ID written into the
+    PDF are derived from a hash of the inputs instead of the clock.
+    """
+    if not config.ARTIFACT_STORE_ENABLED:
+        return None
+    digest = hashlib.sha256("\x00".join(inputs).encode('utf-8')).hexdigest()
+    epoch = SOURCE_DATE_BASE + int(digest[:6], 16)
+    return {**os.environ, "SOURCE_DATE_EPOCH": str(epoch), "FORCE_SOURCE_DATE": "1"}
+
+def _run_latex_compiler(directory):
     main_file_path = os.path.join(directory, config.MAIN_TEX_FILE)
     if not os.path.exists(main_file_path): return False
     print(f"Compiling {config.MAIN_TEX_FILE} to PDF using {config.LATEX_COMPILER}...")
+    env = _reproducible_env(json.dumps(artifact_store.hash_sources(directory), sort_keys=True))
     for i in range(2):
         try:
             process = subprocess.run(
                 [config.LATEX_COMPILER, '-interaction=nonstopmode', config.MAIN_TEX_FILE],
                 cwd=directory, capture_output=True, text=True, encoding='utf-8', errors='ignore',
-                timeout=config.COMPILER_TIMEOUT
+                timeout=config.COMPILER_TIMEOUT, env=env
             )
             if process.returncode != 0:
                 print(f"--- LaTeX Compilation Error (Attempt {i+1}) ---")
@@ -39,6 +67,13 @@ def compile_to_pdf(directory):
 
 def convert_md_to_pdf(md_content, pdf_file_path, metadata):
     """Converts a Markdown string to a PDF using a LaTeX template via Pandoc."""
+    with scheduler.CPU_BUDGET.slot():
+        start = time.monotonic()
+        success = _run_pandoc(md_content, pdf_file_path, metadata)
+    metrics.record_stage("pandoc", time.monotonic() - start, success)
+    return success
+
+def _run_pandoc(md_content, pdf_file_path, metadata):
     print(f"Converting Cover Letter to PDF...")
     
     # Build the command with all the metadata variables
@@ -64,7 +99,8 @@ def convert_md_to_pdf(md_content, pdf_file_path, metadata):
             text=True,
             encoding='utf-8',
             errors='ignore',
-            timeout=120
+            timeout=120,
+            env=_reproducible_env(md_content, json.dumps(metadata, sort_keys=True), config.COVER_LETTER_LATEX_TEMPLATE)
         )
         if process.returncode != 0:
             print(f"--- Pandoc Conversion Error ---")
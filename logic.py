@@ -6,7 +6,67 @@ import config
 import file_utils
 import latex_utils
 import ai_service
+import artifact_store
+import scratch
+import semantic_cache
 import locale
+import threading
+
+_locale_lock = threading.Lock()
+
+COVER_LETTER_PARAGRAPH_PATTERN = re.compile(r"## (?:Cover Letter Paragraph|Anschreiben Absatz) \((.*?)\)\s*\n(.*?)(?=\n## |\Z)", re.DOTALL)
+
+# Profiles and prompts per language, kept between jobs and reloaded only when their files change.
+_language_resources = {}
+
+def get_language_files(lang):
+    """Returns the (profile, prompts, CV project directory) paths for a language."""
+    if lang == "DE":
+        return config.PROFILE_DE_FILE, config.PROMPTS_DE_FILE, config.CV_PROJECT_DE_DIR
+    return config.PROFILE_EN_FILE, config.PROMPTS_EN_FILE, config.CV_PROJECT_EN_DIR
+
+def load_language_resources(lang):
+    """Returns (my_profile, prompts, cv_source_dir) for a language."""
+    profile_path, prompts_path, cv_source_dir = get_language_files(lang)
+
+    file_times = tuple(os.path.getmtime(path) if os.path.exists(path) else None for path in (profile_path, prompts_path))
+    cached = _language_resources.get(lang)
+    if cached and cached[0] == file_times:
+        return cached[1]
+
+    resources = (file_utils.load_text_file(profile_path), file_utils.load_json_file(prompts_path), cv_source_dir)
+    if resources[0] and resources[1]:
+        _language_resources[lang] = (file_times, resources)
+    return resources
+
+def get_variants(job_info):
+    """
+    Returns the (lang, cv_source_dir) pairs to generate for a job, from its 'Variants' column
+    or config.DEFAULT_VARIANTS, e.g. "EN,DE" or "EN,EN:cv_project_modern".
+    """
+    spec = (job_info.get("Variants") or config.DEFAULT_VARIANTS or "").strip()
+    if not spec:
+        lang = job_info.get("Language", "EN").upper()
+        return [(lang, get_language_files(lang)[2])]
+    variants = []
+    for entry in spec.split(","):
+        lang, _, template = entry.strip().partition(":")
+        lang = lang.strip().upper() or "EN"
+        cv_source_dir = os.path.join(config.TEMPLATES_DIR, template.strip()) if template.strip() else get_language_files(lang)[2]
+        if (lang, cv_source_dir) not in variants:
+            variants.append((lang, cv_source_dir))
+    return variants
+
+def get_variant_name(lang, cv_source_dir):
+    """A short name for a CV template variant; empty for the language's default template."""
+    if os.path.normpath(cv_source_dir) == os.path.normpath(get_language_files(lang)[2]):
+        return ""
+    return re.sub(r'[\W_]+', '', os.path.basename(os.path.normpath(cv_source_dir)))
+
+def get_application_folder_name(job_info):
+    """The name of a job's application folder, e.g. 'Acme_FullStackDeveloper'."""
+    job_title_sanitized = re.sub(r'[\W_]+', '', job_info.get('JobTitle', ''))
+    return f"{job_info['CompanyName'].replace(' ', '_')}_{job_title_sanitized}"
 
 def extract_section(profile_text, title_en, title_de):
     """A robust function to extract content under a specific ## heading in either language."""
@@ -26,6 +86,24 @@ def extract_section(profile_text, title_en, title_de):
         print(f"Warning: Could not find section '{title_en}' or '{title_de}' in profile file.")
     return content or ""
 
+def build_summary_context(my_profile, job_info):
+    """The prompt context for the profile summary."""
+    summary_example = extract_section(my_profile, "Example of Desired Summary", "Beispiel für die gewünschte Zusammenfassung")
+    return { "summary_example": summary_example, "my_profile": my_profile, "job_description": job_info["JobDescription"] }
+
+def build_paragraph_context(my_profile, job_info, ai_type, example):
+    """The prompt context for an AI-generated cover letter paragraph."""
+    return {
+        "my_profile": my_profile,
+        "job_description": job_info["JobDescription"],
+        f"{ai_type}_example": example,
+        "target_company_name": job_info.get("CompanyName", "")
+    }
+
+def build_experience_context(my_profile, job_info, base_experience_description):
+    """The prompt context for rewriting one experience block."""
+    return { "my_profile": my_profile, "job_description": job_info["JobDescription"], "base_experience_description": base_experience_description }
+
 def parse_experience_from_profile(profile_text):
     """Parses the profile text to reliably extract experience blocks."""
     experience_data = {}
@@ -43,24 +121,48 @@ def parse_experience_from_profile(profile_text):
                 experience_data[current_placeholder].append(line.strip())
     return experience_data
 
-def process_experience_blocks(model, prompts, my_profile, job_info, temp_app_dir):
-    """Finds, rewrites, and replaces all dynamic experience blocks."""
+def generate_experience_blocks(model, prompts, my_profile, job_info, placeholders=None):
+    """
+    Rewrites the dynamic experience blocks for a job, or only the given placeholders.
+    Returns {placeholder: rewritten text}; blocks that could not be rewritten are left out.
+    """
     print("\nProcessing dynamic experience blocks...")
     experience_blocks = parse_experience_from_profile(my_profile)
     if not experience_blocks or all(not items for items in experience_blocks.values()):
         print("Warning: No dynamic experience blocks were found. Skipping.")
-        return
+        return {}
+    rewritten_blocks = {}
     for placeholder, items in experience_blocks.items():
-        if not items: continue
+        if not items or (placeholders is not None and placeholder not in placeholders): continue
         base_experience_description = "\n".join(items)
-        print(f"Rewriting experience for placeholder: {placeholder}")
-        experience_context = { "my_profile": my_profile, "job_description": job_info["JobDescription"], "base_experience_description": base_experience_description }
-        rewritten_text_block = ai_service.generate_content(model, prompts["experience_block"]["system_instruction"], prompts["experience_block"]["template"], experience_context)
+        lang = job_info.get("Language", "EN").upper()
+        block_key = semantic_cache.make_block_key(placeholder, base_experience_description, prompts["experience_block"], my_profile, lang)
+        rewritten_text_block = semantic_cache.lookup(block_key, job_info["JobDescription"])
+        if not rewritten_text_block:
+            print(f"Rewriting experience for placeholder: {placeholder}")
+            experience_context = build_experience_context(my_profile, job_info, base_experience_description)
+            rewritten_text_block = ai_service.generate_content(model, prompts["experience_block"]["system_instruction"], prompts["experience_block"]["template"], experience_context, prompt_key="experience_block", lang=lang)
+            # Only validated rewrites are stored; the last streaming attempt is accepted without checks.
+            violation = ai_service.validate_response("experience_block", rewritten_text_block, lang) if rewritten_text_block else None
+            if violation:
+                print(f"Not storing the rewrite of {placeholder} for reuse: {violation}.")
+            elif rewritten_text_block:
+                semantic_cache.store(block_key, job_info["JobDescription"], rewritten_text_block, f"{job_info.get('JobTitle', '')} at {job_info.get('CompanyName', '')}")
         if rewritten_text_block:
-            bullet_points = [line.strip() for line in rewritten_text_block.strip().split('\n') if line.strip()]
-            latex_items = [f"    \\item{{{file_utils.sanitize_for_latex(point)}}}" for point in bullet_points]
-            final_block = "\\begin{cvitems}\n" + "\n".join(latex_items) + "\n\\end{cvitems}"
-            file_utils.find_and_replace(temp_app_dir, placeholder, final_block)
+            rewritten_blocks[placeholder] = rewritten_text_block
+    return rewritten_blocks
+
+def apply_experience_blocks(rewritten_blocks, temp_app_dir):
+    """Turns rewritten experience blocks into LaTeX items and replaces their placeholders."""
+    for placeholder, rewritten_text_block in rewritten_blocks.items():
+        bullet_points = [line.strip() for line in rewritten_text_block.strip().split('\n') if line.strip()]
+        latex_items = [f"    \\item{{{file_utils.sanitize_for_latex(point)}}}" for point in bullet_points]
+        final_block = "\\begin{cvitems}\n" + "\n".join(latex_items) + "\n\\end{cvitems}"
+        file_utils.find_and_replace(temp_app_dir, placeholder, final_block)
+
+def process_experience_blocks(model, prompts, my_profile, job_info, temp_app_dir):
+    """Finds, rewrites, and replaces all dynamic experience blocks."""
+    apply_experience_blocks(generate_experience_blocks(model, prompts, my_profile, job_info), temp_app_dir)
 
 def process_cover_letter_paragraphs(model, prompts, my_profile, job_info):
     """
@@ -68,8 +170,7 @@ def process_cover_letter_paragraphs(model, prompts, my_profile, job_info):
     and assembles the full cover letter body.
     """
     print("\nAssembling cover letter paragraphs...")
-    paragraph_pattern = re.compile(r"## (?:Cover Letter Paragraph|Anschreiben Absatz) \((.*?)\)\s*\n(.*?)(?=\n## |\Z)", re.DOTALL)
-    found_paragraphs = paragraph_pattern.findall(my_profile)
+    found_paragraphs = COVER_LETTER_PARAGRAPH_PATTERN.findall(my_profile)
     if not found_paragraphs:
         print("Warning: No 'Cover Letter Paragraph' or 'Anschreiben Absatz' sections found in profile. Body will be empty.")
         return ""
@@ -85,13 +186,8 @@ def process_cover_letter_paragraphs(model, prompts, my_profile, job_info):
             prompt_key = f"cover_letter_{ai_type}"
             if prompt_key in prompts:
                 print(f"Generating AI paragraph for: {ai_type}")
-                context = { 
-                    "my_profile": my_profile, 
-                    "job_description": job_info["JobDescription"], 
-                    f"{ai_type}_example": content,
-                    "target_company_name": job_info.get("CompanyName", "") 
-                }
-                ai_paragraph = ai_service.generate_content(model, prompts[prompt_key]["system_instruction"], prompts[prompt_key]["template"], context)
+                context = build_paragraph_context(my_profile, job_info, ai_type, content)
+                ai_paragraph = ai_service.generate_content(model, prompts[prompt_key]["system_instruction"], prompts[prompt_key]["template"], context, prompt_key=prompt_key, lang=job_info.get("Language", "EN").upper())
                 paragraph_to_add = ai_paragraph or ""
         elif tag == "static":
             print("Adding static paragraph.")
@@ -104,17 +200,8 @@ def process_cover_letter_paragraphs(model, prompts, my_profile, job_info):
     return "\n\n".join(final_body_parts)
 
 
-def handle_successful_compilation(job_info, lang, cover_letter_body, temp_app_dir, final_app_dir):
-    """Saves final files, creates the cover letter PDF, updates CSV, and cleans up."""
-    # Sanitize ALL text inputs from the CSV file first.
-    company_name = file_utils.sanitize_for_latex(job_info.get('CompanyName', ''))
-    job_title = file_utils.sanitize_for_latex(job_info.get('JobTitle', ''))
-    hr_name = file_utils.sanitize_for_latex(job_info.get('HRManagerName', ''))
-    company_street = file_utils.sanitize_for_latex(job_info.get('CompanyStreet', ''))
-    company_city = file_utils.sanitize_for_latex(job_info.get('CompanyCity', ''))
-    
-    os.makedirs(final_app_dir, exist_ok=True)
-
+def get_output_filenames(job_info, lang, variant_name=""):
+    """Returns the (CV, cover letter) PDF file names for a job. Template variants get their name appended to the CV."""
     author_name_sanitized = config.AUTHOR_INFO["name"].replace(" ", "")
     company_name_sanitized = job_info['CompanyName'].replace(" ", "_")
     
@@ -124,34 +211,61 @@ def handle_successful_compilation(job_info, lang, cover_letter_body, temp_app_di
     else:
         cv_filename = f"CV_{author_name_sanitized}_{company_name_sanitized}.pdf"
         cl_filename = f"CoverLetter_{author_name_sanitized}_{company_name_sanitized}.pdf"
+    if variant_name:
+        cv_filename = cv_filename.replace(".pdf", f"_{variant_name}.pdf")
+    return cv_filename, cl_filename
+
+def save_cv_pdf(job_info, lang, temp_app_dir, final_app_dir, variant_name=""):
+    """Moves the compiled CV into the final application folder. Returns its new path."""
+    os.makedirs(final_app_dir, exist_ok=True)
+    cv_filename, _ = get_output_filenames(job_info, lang, variant_name)
 
-    shutil.move(
-        os.path.join(temp_app_dir, config.MAIN_TEX_FILE.replace('.tex', '.pdf')),
-        os.path.join(final_app_dir, cv_filename)
-    )
+    compiled_cv_path = os.path.join(temp_app_dir, config.MAIN_TEX_FILE.replace('.tex', '.pdf'))
+    if config.ARTIFACT_STORE_ENABLED:
+        cv_digest = artifact_store.put_file(compiled_cv_path)
+        artifact_store.link_file(cv_digest, os.path.join(final_app_dir, cv_filename))
+        artifact_store.write_manifest(final_app_dir, {cv_filename: cv_digest}, artifact_store.store_sources(temp_app_dir, prefix="_".join(part for part in (lang, variant_name) if part)))
+    else:
+        shutil.move(compiled_cv_path, os.path.join(final_app_dir, cv_filename))
     print(f"✅ CV saved to: {os.path.join(final_app_dir, cv_filename)}")
+    return os.path.join(final_app_dir, cv_filename)
 
-    hr_gender = job_info.get('HRManagerGender', '').upper()
-    
+def format_letter_date(lang):
+    """Formats today's date for the cover letter in the job's language."""
     if lang == 'DE':
+        locale_name, date_format, language_name = 'de_DE.UTF-8', "%d. %B %Y", "German"
+    else:
+        locale_name, date_format, language_name = 'en_US.UTF-8', "%B %d, %Y", "English"
+    # The locale is process-wide, so parallel jobs must not switch it while another one is formatting.
+    with _locale_lock:
         try:
-            locale.setlocale(locale.LC_TIME, 'de_DE.UTF-8')
+            locale.setlocale(locale.LC_TIME, locale_name)
         except locale.Error:
-            print("Warning: German locale not found. Using default date format.")
-        
-        date_str = datetime.date.today().strftime("%d. %B %Y")
+            print(f"Warning: {language_name} locale not found. Using default date format.")
+        return datetime.date.today().strftime(date_format)
+
+def create_cover_letter_pdf(job_info, lang, cover_letter_body, final_app_dir):
+    """Creates the cover letter PDF in the final application folder. Returns its path, or None on failure."""
+    # Sanitize ALL text inputs from the CSV file first.
+    company_name = file_utils.sanitize_for_latex(job_info.get('CompanyName', ''))
+    job_title = file_utils.sanitize_for_latex(job_info.get('JobTitle', ''))
+    hr_name = file_utils.sanitize_for_latex(job_info.get('HRManagerName', ''))
+    company_street = file_utils.sanitize_for_latex(job_info.get('CompanyStreet', ''))
+    company_city = file_utils.sanitize_for_latex(job_info.get('CompanyCity', ''))
+    
+    os.makedirs(final_app_dir, exist_ok=True)
+    _, cl_filename = get_output_filenames(job_info, lang)
+
+    hr_gender = job_info.get('HRManagerGender', '').upper()
+    
+    date_str = format_letter_date(lang)
+    if lang == 'DE':
         salutation = "Sehr geehrte Damen und Herren,"
         if hr_name and hr_gender == 'F': salutation = f"Sehr geehrte Frau {hr_name},"
         elif hr_name and hr_gender == 'M': salutation = f"Sehr geehrter Herr {hr_name},"
         application_subject = f"Bewerbung um die Stelle als {job_title}"
         final_body = f"{cover_letter_body}\n\nMit freundlichen Grüßen,\n\n{config.AUTHOR_INFO['name']}"
     else:
-        try:
-            locale.setlocale(locale.LC_TIME, 'en_US.UTF-8')
-        except locale.Error:
-            print("Warning: English locale not found. Using default date format.")
-
-        date_str = datetime.date.today().strftime("%B %d, %Y")
         salutation = "Dear Hiring Team,"
         if hr_name and hr_gender == 'F': salutation = f"Dear Ms. {hr_name},"
         elif hr_name and hr_gender == 'M': salutation = f"Dear Mr. {hr_name},"
@@ -180,11 +294,27 @@ def handle_successful_compilation(job_info, lang, cover_letter_body, temp_app_di
     }
     
     pdf_file_path = os.path.join(final_app_dir, cl_filename)
-    latex_utils.convert_md_to_pdf("", pdf_file_path, metadata)
+    if not latex_utils.convert_md_to_pdf("", pdf_file_path, metadata):
+        return None
+    if config.ARTIFACT_STORE_ENABLED:
+        artifact_store.write_manifest(final_app_dir, {cl_filename: artifact_store.store_output(pdf_file_path)})
+    return pdf_file_path
 
+def commit_job_status(job_info):
+    """Marks a job as generated in the CSV file."""
     file_utils.update_csv_status(config.JOBS_CSV_FILE, job_info['CompanyName'], job_info['JobTitle'], f"Generated on {datetime.date.today()}")
     print(f"\nSuccessfully processed application for {job_info['JobTitle']} at {job_info['CompanyName']}.")
 
+def cleanup_temp_dir(temp_app_dir):
+    """Removes the temporary build folder of an application and releases its scratch space."""
     if os.path.exists(temp_app_dir):
         shutil.rmtree(temp_app_dir)
         print("Temporary directory cleaned up.")
+    scratch.release(temp_app_dir)
+
+def handle_successful_compilation(job_info, lang, cover_letter_body, temp_app_dir, final_app_dir):
+    """Saves final files, creates the cover letter PDF, updates CSV, and cleans up."""
+    save_cv_pdf(job_info, lang, temp_app_dir, final_app_dir)
+    create_cover_letter_pdf(job_info, lang, cover_letter_body, final_app_dir)
+    commit_job_status(job_info)
+    cleanup_temp_dir(temp_app_dir)
@@ -1,14 +1,292 @@
+import argparse
+import contextvars
 import os
-import re
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 import config
 import file_utils
 import latex_utils
 import ai_service
+import artifact_store
+import checkpoint
+import csv_watcher
 import logic
+import metrics
+import planner
+import scheduler
+import scratch
+import semantic_cache
+
+def generate_ai_outputs(model, job_info, lang, my_profile, prompts, journal):
+    """Generates the AI content for a job in one language, or reuses it from the journal. Returns None on failure."""
+    inputs_hash = checkpoint.hash_inputs(my_profile, prompts)
+    ai_outputs = journal.get(checkpoint.STAGE_AI_GENERATION)
+    if ai_outputs is not None and ai_outputs.get("inputs") != inputs_hash:
+        print(f"The {lang} profile or prompts changed since the checkpoint. Regenerating the AI content...")
+        journal.invalidate_from(checkpoint.STAGE_AI_GENERATION)
+        ai_outputs = None
+    if ai_outputs is not None and not ai_outputs.get("missing_experience_blocks"):
+        print(f"✅ Reusing {lang} AI content from checkpoint.")
+        return ai_outputs
+
+    if ai_outputs is not None:
+        # Only the experience blocks that failed last time are generated again.
+        missing = ai_outputs["missing_experience_blocks"]
+        print(f"Reusing {lang} AI content from checkpoint and regenerating {len(missing)} missing experience blocks...")
+        ai_outputs["experience_blocks"].update(logic.generate_experience_blocks(model, prompts, my_profile, job_info, missing))
+    else:
+        print(f"Generating content in {lang}...")
+        
+        summary_context = logic.build_summary_context(my_profile, job_info)
+        custom_summary = ai_service.generate_content(model, prompts["profile_summary"]["system_instruction"], prompts["profile_summary"]["template"], summary_context, prompt_key="profile_summary", lang=lang)
+
+        cover_letter_body = logic.process_cover_letter_paragraphs(model, prompts, my_profile, job_info)
+
+        if not custom_summary or not cover_letter_body:
+            print("Failed to generate all required AI content. Skipping to next job.")
+            return None
+
+        experience_blocks = logic.generate_experience_blocks(model, prompts, my_profile, job_info)
+        ai_outputs = {"custom_summary": custom_summary, "cover_letter_body": cover_letter_body, "experience_blocks": experience_blocks, "inputs": inputs_hash}
+
+    missing = [placeholder for placeholder, items in logic.parse_experience_from_profile(my_profile).items()
+               if items and placeholder not in ai_outputs["experience_blocks"]]
+    ai_outputs["missing_experience_blocks"] = missing
+    journal.complete(checkpoint.STAGE_AI_GENERATION, ai_outputs)
+    if missing:
+        print(f"Failed to rewrite the experience blocks {', '.join(missing)}. They will be regenerated on the next run.")
+        return None
+    print("✅ AI content generated successfully.")
+    return ai_outputs
+
+def build_cv(job_info, lang, cv_source_dir, variant_name, ai_outputs, journal, build_name, final_app_dir):
+    """Renders the AI content into a copy of the CV project and compiles it. Returns True on success."""
+    temp_app_dir = scratch.job_dir(build_name, cv_source_dir)
+
+    # A variant built from AI content that has since been regenerated is built again.
+    render_outputs = journal.get(checkpoint.STAGE_TEMPLATE_RENDER)
+    if render_outputs is not None and render_outputs.get("inputs") != ai_outputs["inputs"]:
+        journal.invalidate_from(checkpoint.STAGE_TEMPLATE_RENDER)
+
+    cv_outputs = journal.get(checkpoint.STAGE_CV_COMPILE)
+    if cv_outputs is not None and not os.path.exists(cv_outputs["cv_path"]):
+        journal.invalidate_from(checkpoint.STAGE_CV_COMPILE)
+        cv_outputs = None
+    if cv_outputs is not None:
+        logic.cleanup_temp_dir(temp_app_dir)
+        return True
+
+    # Update CV with AI Content
+    render_outputs = journal.get(checkpoint.STAGE_TEMPLATE_RENDER)
+    if render_outputs is not None and render_outputs["sources"] != artifact_store.hash_sources(temp_app_dir):
+        journal.invalidate_from(checkpoint.STAGE_TEMPLATE_RENDER)
+        render_outputs = None
+    if render_outputs is None:
+        if os.path.exists(temp_app_dir): shutil.rmtree(temp_app_dir)
+        shutil.copytree(cv_source_dir, temp_app_dir)
+
+        sanitized_summary = file_utils.sanitize_for_latex(ai_outputs["custom_summary"])
+        file_utils.find_and_replace(temp_app_dir, config.PROFILE_SUMMARY_PLACEHOLDER, sanitized_summary)
+        logic.apply_experience_blocks(ai_outputs["experience_blocks"], temp_app_dir)
+        journal.complete(checkpoint.STAGE_TEMPLATE_RENDER, {"sources": artifact_store.hash_sources(temp_app_dir), "inputs": ai_outputs["inputs"]})
+
+    # Compile Final PDF
+    if not latex_utils.compile_to_pdf(temp_app_dir):
+        print("\n--- Compilation Failed ---")
+        debug_dir = scratch.keep_failed_build(temp_app_dir, build_name)
+        print(f"The build folder has been kept for debugging at: '{debug_dir}'")
+        print("Please check the .log file inside that folder to find the specific LaTeX error.")
+        return False
+    journal.complete(checkpoint.STAGE_CV_COMPILE, {"cv_path": logic.save_cv_pdf(job_info, lang, temp_app_dir, final_app_dir, variant_name)})
+    logic.cleanup_temp_dir(temp_app_dir)
+    return True
+
+def process_job(model, job_info):
+    """
+    Generates the AI content, compiles the CV and creates the cover letter for a single job.
+    A job produces one application per variant (see logic.get_variants). Variants in the same
+    language share their AI content and cover letter, and their CVs are compiled in parallel.
+    Returns True on success, False if the job failed, and None if the run should stop.
+    """
+    variants = logic.get_variants(job_info)
+    for lang, cv_source_dir in variants:
+        if not os.path.isdir(cv_source_dir):
+            print(f"Error: The CV project directory was not found at '{cv_source_dir}'")
+            return False # Skip to the next job
+
+    folder_name = logic.get_application_folder_name(job_info)
+    final_app_dir = os.path.join(config.APPLICATIONS_DIR, folder_name)
+
+    # Generate AI Content once per language
+    languages = {}
+    for lang in dict.fromkeys(lang for lang, _ in variants):
+        # Load language-specific files based on the variant's language
+        my_profile, prompts, _ = logic.load_language_resources(lang)
+        if not my_profile or not prompts:
+            print("Could not load profile or prompt files. Exiting.")
+            return None
+
+        language_job = {**job_info, "Language": lang}
+        journal = checkpoint.JobJournal(language_job)
+        if journal.last_finished_stage():
+            print(f"Resuming {lang} from checkpoint (last finished stage: {journal.last_finished_stage()}).")
+        # AI calls are attributed to the language they are made in, not to the row's 'Language'.
+        with metrics.job_scope(get_job_label(job_info), lang):
+            ai_outputs = generate_ai_outputs(model, language_job, lang, my_profile, prompts, journal)
+        if ai_outputs is None:
+            return False
+        languages[lang] = (language_job, journal, ai_outputs)
+
+    # Compile the CV of every variant
+    builds = []
+    for lang, cv_source_dir in variants:
+        language_job, language_journal, ai_outputs = languages[lang]
+        variant_name = logic.get_variant_name(lang, cv_source_dir)
+        journal = checkpoint.JobJournal(language_job, variant_name) if variant_name else language_journal
+        build_name = "_".join(part for part in (folder_name, lang, variant_name) if part)
+        builds.append((language_job, lang, cv_source_dir, variant_name, ai_outputs, journal, build_name, final_app_dir))
+    if len(builds) == 1:
+        results = [build_cv(*builds[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=len(builds), thread_name_prefix="cv-build") as executor:
+            futures = [executor.submit(contextvars.copy_context().run, build_cv, *build) for build in builds]
+            results = [future.result() for future in futures]
+    if not all(results):
+        return False
+
+    # Create the Cover Letter once per language
+    for lang, (language_job, journal, ai_outputs) in languages.items():
+        cover_letter_outputs = journal.get(checkpoint.STAGE_COVER_LETTER_COMPILE)
+        if cover_letter_outputs is None or not os.path.exists(cover_letter_outputs["cover_letter_path"]):
+            cover_letter_path = logic.create_cover_letter_pdf(language_job, lang, ai_outputs["cover_letter_body"], final_app_dir)
+            if not cover_letter_path:
+                print("Cover letter creation failed. The job will resume from this step on the next run.")
+                return False
+            journal.complete(checkpoint.STAGE_COVER_LETTER_COMPILE, {"cover_letter_path": cover_letter_path})
+
+    # Commit the Status
+    logic.commit_job_status(job_info)
+    for _, journal, _ in languages.values():
+        journal.complete(checkpoint.STAGE_STATUS_COMMIT)
+    for build in builds:
+        build[5].discard()
+    for _, journal, _ in languages.values():
+        journal.discard()
+    return True
+
+def discard_checkpoints(jobs):
+    """Deletes the checkpoint journals of the given jobs, so they are processed from scratch."""
+    for job_info in jobs:
+        for lang, cv_source_dir in logic.get_variants(job_info):
+            language_job = {**job_info, "Language": lang}
+            checkpoint.JobJournal(language_job).discard()
+            variant_name = logic.get_variant_name(lang, cv_source_dir)
+            if variant_name:
+                checkpoint.JobJournal(language_job, variant_name).discard()
+    if jobs:
+        print(f"Discarded the checkpoints of {len(jobs)} pending jobs.")
+
+def get_job_label(job_info):
+    """The label a job's usage is reported under."""
+    return f"{job_info.get('JobTitle')} at {job_info.get('CompanyName')}"
+
+def run_job(model, job_info):
+    """Processes a single job inside its metrics scope and prints its usage. Returns process_job's result."""
+    job_label = get_job_label(job_info)
+    with metrics.job_scope(job_label, job_info.get("Language", "EN").upper()):
+        success = process_job(model, job_info)
+    if success is not None:
+        metrics.record_job_finished(success)
+        metrics.print_job_summary(job_label)
+    return success
+
+def _job_done(progress):
+    progress.job_finished()
+    print("-" * 40)
+
+def print_run_summaries():
+    """Prints the hedging, reuse and usage statistics of this run."""
+    ai_service.print_hedge_stats()
+    semantic_cache.print_stats()
+    scheduler.print_stats()
+    metrics.print_run_summary()
+    metrics.save_latency_history()
+
+def watch_jobs(model):
+    """
+    Keeps running and processes rows as they are appended to the jobs CSV.
+    The model, profiles and prompts stay loaded, and only the newly appended bytes of the CSV are read.
+    """
+    reader = csv_watcher.CsvTailReader(config.JOBS_CSV_FILE)
+    watcher = csv_watcher.CsvWatcher(config.JOBS_CSV_FILE)
+    # Rows stay pending until they succeed, so failed or stopped rows are retried on the next change,
+    # up to config.WATCH_MAX_ATTEMPTS failures per row.
+    pending_jobs = {}
+    done_job_ids = set()
+    failures = {}
+
+    def job_finished(progress, job_info, result):
+        job_id = checkpoint.get_job_id(job_info)
+        if result:
+            done_job_ids.add(job_id)
+        elif result is not None:
+            failures[job_id] = failures.get(job_id, 0) + 1
+            if failures[job_id] >= config.WATCH_MAX_ATTEMPTS:
+                print(f"Giving up on '{get_job_label(job_info)}' after {failures[job_id]} failed attempts. Restart the watcher to try it again.")
+                done_job_ids.add(job_id)
+        _job_done(progress)
+
+    try:
+        while True:
+            for row in reader.read_new_rows():
+                job_id = checkpoint.get_job_id(row)
+                if not row.get('Status', '').strip() and job_id not in done_job_ids:
+                    pending_jobs.setdefault(job_id, row)
+            jobs = list(pending_jobs.values())
+            if jobs:
+                print(f"\nFound {len(jobs)} pending job applications to process.")
+                print("-" * 40)
+            progress = metrics.ProgressTracker(len(jobs))
+            if not scheduler.run_jobs(jobs, lambda job_info: run_job(model, job_info), progress.job_started, lambda job_info, result: job_finished(progress, job_info, result), logic.get_application_folder_name):
+                print("Stopped this batch until the profile or prompt files are fixed.")
+            for job_id in done_job_ids.intersection(pending_jobs):
+                del pending_jobs[job_id]
+            watcher.wait_for_change()
+    except KeyboardInterrupt:
+        print("\nStopped watching for new jobs.")
+    finally:
+        watcher.close()
+        print_run_summaries()
+
+def parse_arguments():
+    """Parses the command line options."""
+    parser = argparse.ArgumentParser(description="Generates tailored CVs and cover letters for the pending jobs in the jobs CSV.")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--watch", action="store_true", help=f"keep running and process rows as they are appended to {config.JOBS_CSV_FILE}")
+    mode.add_argument("--plan", action="store_true", help="estimate AI calls, tokens, compiles and wall time without calling the API or compiler")
+    parser.add_argument("--restart", action="store_true", help="discard the checkpoints of pending jobs and generate them from scratch")
+    parser.add_argument("--jobs", type=int, metavar="N", help=f"process up to N jobs at once (default: {config.MAX_PARALLEL_JOBS})")
+    parser.add_argument("--variants", metavar="SPEC", help='applications to generate per job, e.g. "EN,DE" or "EN,EN:cv_project_modern" (a "Variants" column in the CSV takes precedence)')
+    return parser.parse_args()
 
 def main():
     """Main function to orchestrate the job application automation."""
+    args = parse_arguments()
+    if args.variants:
+        config.DEFAULT_VARIANTS = args.variants
+    if args.jobs:
+        config.MAX_PARALLEL_JOBS = max(1, args.jobs)
+    if args.restart and not args.plan:
+        discard_checkpoints(file_utils.get_all_pending_jobs(config.JOBS_CSV_FILE))
+
+    if args.plan:
+        pending_jobs = file_utils.get_all_pending_jobs(config.JOBS_CSV_FILE)
+        if not pending_jobs:
+            print("\nNo new jobs to process. All applications are up to date!")
+            return
+        planner.print_plan(scheduler.order_jobs(pending_jobs))
+        return
+
     # 1. Initial Setup and Checks
     if not latex_utils.check_dependencies():
         return
@@ -17,8 +295,17 @@ def main():
     if not model:
         return
 
+    metrics.start_metrics_server()
+    if config.ARTIFACT_STORE_ENABLED:
+        artifact_store.collect_garbage()
+    scratch.cleanup_stale_runs()
+
+    if args.watch:
+        watch_jobs(model)
+        return
+
     # 2. Get all pending jobs from the CSV
-    pending_jobs = file_utils.get_all_pending_jobs(config.JOBS_CSV_FILE)
+    pending_jobs = scheduler.order_jobs(file_utils.get_all_pending_jobs(config.JOBS_CSV_FILE))
     if not pending_jobs:
         print("\nNo new jobs to process. All applications are up to date!")
         return
@@ -28,69 +315,11 @@ def main():
     print("-" * 40)
 
     # 3. Loop through each pending job and process it
-    for i, job_info in enumerate(pending_jobs):
-        print(f"Processing Job {i+1} of {total_jobs}: {job_info.get('JobTitle')} at {job_info.get('CompanyName')}")
-        
-        # Load language-specific files based on the job's language
-        lang = job_info.get("Language", "EN").upper()
-        if lang == "DE":
-            profile_path, prompts_path, cv_source_dir = config.PROFILE_DE_FILE, config.PROMPTS_DE_FILE, config.CV_PROJECT_DE_DIR
-        else:
-            profile_path, prompts_path, cv_source_dir = config.PROFILE_EN_FILE, config.PROMPTS_EN_FILE, config.CV_PROJECT_EN_DIR
-
-        if not os.path.isdir(cv_source_dir):
-            print(f"Error: The CV project directory was not found at '{cv_source_dir}'")
-            continue # Skip to the next job
-
-        my_profile = file_utils.load_text_file(profile_path)
-        prompts = file_utils.load_json_file(prompts_path)
-        if not my_profile or not prompts:
-            print("Could not load profile or prompt files. Exiting.")
-            return
-
-        # Generate AI Content
-        print(f"Generating content in {lang}...")
-        
-        summary_example = logic.extract_section(my_profile, "Example of Desired Summary", "Beispiel für die gewünschte Zusammenfassung")
-        summary_context = { "summary_example": summary_example, "my_profile": my_profile, "job_description": job_info["JobDescription"] }
-        custom_summary = ai_service.generate_content(model, prompts["profile_summary"]["system_instruction"], prompts["profile_summary"]["template"], summary_context)
-
-        cover_letter_body = logic.process_cover_letter_paragraphs(model, prompts, my_profile, job_info)
-
-        if not custom_summary or not cover_letter_body:
-            print("Failed to generate all required AI content. Skipping to next job.")
-            continue
-        
-        print("✅ AI content generated successfully.")
-
-        # Prepare Temporary Directory for this Application
-        company_name = job_info['CompanyName']
-        # temp_app_dir = os.path.join(config.APPLICATIONS_DIR, f"_{company_name.replace(' ', '_')}_temp")
-        # final_app_dir = os.path.join(config.APPLICATIONS_DIR, company_name.replace(" ", "_"))
-        job_title_sanitized = re.sub(r'[\W_]+', '', job_info.get('JobTitle', '')) 
-        
-        folder_name = f"{company_name.replace(' ', '_')}_{job_title_sanitized}"
-        final_app_dir = os.path.join(config.APPLICATIONS_DIR, folder_name)
-        temp_app_dir = os.path.join(config.APPLICATIONS_DIR, f"_{folder_name}_temp")
-        
-        if os.path.exists(temp_app_dir): shutil.rmtree(temp_app_dir)
-        shutil.copytree(cv_source_dir, temp_app_dir)
-
-        # Update CV with AI Content
-        sanitized_summary = file_utils.sanitize_for_latex(custom_summary)
-        file_utils.find_and_replace(temp_app_dir, config.PROFILE_SUMMARY_PLACEHOLDER, sanitized_summary)
-        logic.process_experience_blocks(model, prompts, my_profile, job_info, temp_app_dir)
-
-        # Compile Final PDF
-        if latex_utils.compile_to_pdf(temp_app_dir):
-            logic.handle_successful_compilation(job_info, lang, cover_letter_body, temp_app_dir, final_app_dir)
-        else:
-            print("\n--- Compilation Failed ---")
-            print(f"The temporary folder has been kept for debugging at: '{temp_app_dir}'")
-            print("Please check the .log file inside that folder to find the specific LaTeX error.")
-        
-        print("-" * 40)
+    progress = metrics.ProgressTracker(total_jobs)
+    if not scheduler.run_jobs(pending_jobs, lambda job_info: run_job(model, job_info), progress.job_started, lambda job_info, result: _job_done(progress), logic.get_application_folder_name):
+        return
     
+    print_run_summaries()
     print("All pending jobs have been processed.")
 
 if __name__ == "__main__":
@@ -0,0 +1,259 @@
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import config
+
+_lock = threading.Lock()
+_current_job = contextvars.ContextVar("current_job", default=None)
+
+# Token and latency totals, rolled up per job, per language and for the whole run.
+_job_totals = {}
+_language_totals = {}
+
+# Prometheus-style counters and histograms, keyed by (name, labels).
+_counters = {}
+_gauges = {}
+_histograms = {}
+
+# Sum and count of successful stage latencies this run, keyed by stage ('ai:<prompt>', 'compile', 'pandoc').
+_stage_latencies = {}
+
+def _empty_totals():
+    return {"calls": 0, "failed_calls": 0, "input_tokens": 0, "output_tokens": 0, "ai_seconds": 0.0}
+
+_run_totals = _empty_totals()
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def _inc_counter(name, labels, amount=1):
+    key = (name, _label_key(labels))
+    _counters[key] = _counters.get(key, 0) + amount
+
+def _observe_histogram(name, labels, value):
+    key = (name, _label_key(labels))
+    histogram = _histograms.setdefault(key, {"buckets": [0] * len(config.METRICS_LATENCY_BUCKETS), "sum": 0.0, "count": 0})
+    for i, bound in enumerate(config.METRICS_LATENCY_BUCKETS):
+        if value <= bound:
+            histogram["buckets"][i] += 1
+    histogram["sum"] += value
+    histogram["count"] += 1
+
+@contextlib.contextmanager
+def job_scope(job_label, lang):
+    """Attributes all AI calls made inside the block to this job and language."""
+    token = _current_job.set((job_label, lang))
+    try:
+        yield
+    finally:
+        _current_job.reset(token)
+
+def estimate_tokens(text):
+    """Rough token estimate (about 4 characters per token) for when the API reports no usage."""
+    return max(1, len(text) // 4) if text else 0
+
+def get_usage(response, prompt, output_text):
+    """Returns (input_tokens, output_tokens) from a response's usage metadata, or estimates them."""
+    usage = getattr(response, "usage_metadata", None)
+    input_tokens = getattr(usage, "prompt_token_count", 0) or 0
+    output_tokens = getattr(usage, "candidates_token_count", 0) or 0
+    if not input_tokens:
+        input_tokens = estimate_tokens(prompt)
+    if not output_tokens:
+        output_tokens = estimate_tokens(output_text)
+    return input_tokens, output_tokens
+
+def record_ai_call(prompt_key, seconds, input_tokens, output_tokens, outcome="ok"):
+    """Records one AI request. outcome is 'ok', 'cancelled' or 'error'."""
+    job = _current_job.get()
+    job_label, lang = job if job else ("(no job)", "")
+    with _lock:
+        for totals in (_run_totals, _job_totals.setdefault(job_label, _empty_totals()), _language_totals.setdefault(lang or "-", _empty_totals())):
+            totals["calls"] += 1
+            totals["failed_calls"] += int(outcome != "ok")
+            totals["input_tokens"] += input_tokens
+            totals["output_tokens"] += output_tokens
+            totals["ai_seconds"] += seconds
+        labels = {"prompt": prompt_key or "unknown", "lang": lang or "-"}
+        _inc_counter("jobautomator_ai_calls_total", {**labels, "outcome": outcome})
+        _inc_counter("jobautomator_ai_tokens_total", {**labels, "direction": "input"}, input_tokens)
+        _inc_counter("jobautomator_ai_tokens_total", {**labels, "direction": "output"}, output_tokens)
+        _observe_histogram("jobautomator_ai_call_seconds", labels, seconds)
+        if outcome == "ok":
+            _add_stage_latency(f"ai:{prompt_key or 'unknown'}", seconds)
+
+def record_stage(stage, seconds, success):
+    """Records a non-AI pipeline stage such as 'compile' or 'pandoc'."""
+    with _lock:
+        _inc_counter("jobautomator_stage_runs_total", {"stage": stage, "outcome": "ok" if success else "error"})
+        _observe_histogram("jobautomator_stage_seconds", {"stage": stage}, seconds)
+        if success:
+            _add_stage_latency(stage, seconds)
+
+def _add_stage_latency(stage, seconds):
+    total = _stage_latencies.setdefault(stage, [0.0, 0])
+    total[0] += seconds
+    total[1] += 1
+
+def load_latency_history():
+    """Returns the stored average latency per stage as {stage: {"mean": seconds, "count": n}}."""
+    try:
+        with open(config.LATENCY_HISTORY_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_latency_history():
+    """Merges this run's stage latencies into the stored averages used by the planner."""
+    with _lock:
+        measured = {stage: tuple(total) for stage, total in _stage_latencies.items()}
+    if not measured:
+        return
+    history = load_latency_history()
+    for stage, (total_seconds, count) in measured.items():
+        previous = history.get(stage, {"mean": 0.0, "count": 0})
+        # Older runs count for at most 100 samples so the averages follow slower or faster APIs.
+        previous_count = min(previous["count"], 100)
+        combined = previous_count + count
+        history[stage] = {"mean": (previous["mean"] * previous_count + total_seconds) / combined, "count": combined}
+    try:
+        os.makedirs(os.path.dirname(config.LATENCY_HISTORY_FILE) or ".", exist_ok=True)
+        temp_path = config.LATENCY_HISTORY_FILE + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(history, f, indent=2)
+        os.replace(temp_path, config.LATENCY_HISTORY_FILE)
+    except OSError as e:
+        print(f"Warning: Could not save stage latencies: {e}")
+
+def record_wait(resource, seconds):
+    """Records how long a job or stage waited, e.g. in the job queue or for an AI or CPU slot."""
+    with _lock:
+        _observe_histogram("jobautomator_wait_seconds", {"resource": resource}, seconds)
+
+def set_gauge(name, labels, value):
+    """Sets a gauge such as the current queue depth."""
+    with _lock:
+        _gauges[(name, _label_key(labels))] = value
+
+def record_job_finished(success):
+    """Counts a finished job."""
+    with _lock:
+        _inc_counter("jobautomator_jobs_total", {"outcome": "ok" if success else "error"})
+
+def estimate_cost(totals):
+    """Estimated cost in USD for a totals dict."""
+    return (totals["input_tokens"] * config.AI_PRICE_PER_MILLION_INPUT_TOKENS
+            + totals["output_tokens"] * config.AI_PRICE_PER_MILLION_OUTPUT_TOKENS) / 1_000_000
+
+def _format_totals(totals):
+    return (f"{totals['calls']} AI calls ({totals['failed_calls']} failed/cancelled), "
+            f"{totals['input_tokens']} input / {totals['output_tokens']} output tokens, "
+            f"{totals['ai_seconds']:.1f}s in AI, ~${estimate_cost(totals):.4f}")
+
+def print_job_summary(job_label):
+    """Prints the token and latency totals of a single job."""
+    with _lock:
+        totals = dict(_job_totals.get(job_label, _empty_totals()))
+    print(f"Usage for this job: {_format_totals(totals)}")
+
+def print_run_summary():
+    """Prints the token, latency and cost totals per language and for the whole run."""
+    with _lock:
+        run_totals = dict(_run_totals)
+        language_totals = {lang: dict(totals) for lang, totals in _language_totals.items()}
+    if not run_totals["calls"]:
+        return
+    for lang, totals in sorted(language_totals.items()):
+        print(f"Usage for {lang}: {_format_totals(totals)}")
+    print(f"Usage for this run: {_format_totals(run_totals)}")
+
+class ProgressTracker:
+    """Prints progress, throughput and an ETA while a batch of jobs is processed."""
+
+    def __init__(self, total_jobs):
+        self.total_jobs = total_jobs
+        self.finished_jobs = 0
+        self.start_time = time.monotonic()
+
+    def job_started(self, index, job_info):
+        elapsed = time.monotonic() - self.start_time
+        status = f"Processing Job {index+1} of {self.total_jobs}: {job_info.get('JobTitle')} at {job_info.get('CompanyName')}"
+        if self.finished_jobs:
+            seconds_per_job = elapsed / self.finished_jobs
+            remaining = seconds_per_job * (self.total_jobs - self.finished_jobs)
+            with _lock:
+                tokens = _run_totals["input_tokens"] + _run_totals["output_tokens"]
+            status += (f" | {format_duration(elapsed)} elapsed, ETA {format_duration(remaining)}"
+                       f" | {60 / seconds_per_job:.1f} jobs/min, {tokens / elapsed * 60:.0f} tokens/min")
+        print(status)
+
+    def job_finished(self):
+        with _lock:
+            self.finished_jobs += 1
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m{seconds:02d}s" if hours else f"{minutes}m{seconds:02d}s"
+
+def _format_labels(labels):
+    return ",".join(f'{name}="{value}"' for name, value in labels)
+
+def render_prometheus():
+    """Renders all counters and histograms in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        for name in sorted({name for name, _ in _counters}):
+            lines.append(f"# TYPE {name} counter")
+            for (counter_name, labels), value in sorted(_counters.items()):
+                if counter_name == name:
+                    lines.append(f"{name}{{{_format_labels(labels)}}} {value}")
+        for name in sorted({name for name, _ in _gauges}):
+            lines.append(f"# TYPE {name} gauge")
+            for (gauge_name, labels), value in sorted(_gauges.items()):
+                if gauge_name == name:
+                    lines.append(f"{name}{{{_format_labels(labels)}}} {value}")
+        for name in sorted({name for name, _ in _histograms}):
+            lines.append(f"# TYPE {name} histogram")
+            for (histogram_name, labels), histogram in sorted(_histograms.items()):
+                if histogram_name != name:
+                    continue
+                prefix = _format_labels(labels) + "," if labels else ""
+                for bound, count in zip(config.METRICS_LATENCY_BUCKETS, histogram["buckets"]):
+                    lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {histogram["count"]}')
+                lines.append(f"{name}_sum{{{_format_labels(labels)}}} {histogram['sum']:.6f}")
+                lines.append(f"{name}_count{{{_format_labels(labels)}}} {histogram['count']}")
+    return "\n".join(lines) + "\n"
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Keep the console output for the pipeline itself
+
+def start_metrics_server():
+    """Starts the metrics endpoint in a background thread if config.METRICS_PORT is set."""
+    if not config.METRICS_PORT:
+        return None
+    try:
+        server = ThreadingHTTPServer((config.METRICS_HOST, config.METRICS_PORT), _MetricsHandler)
+    except OSError as e:
+        print(f"Warning: Could not start metrics endpoint on port {config.METRICS_PORT}: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics-server").start()
+    print(f"✅ Metrics available at http://{config.METRICS_HOST}:{config.METRICS_PORT}/metrics")
+    return server
@@ -0,0 +1,137 @@
+import checkpoint
+import config
+import logic
+import metrics
+import semantic_cache
+
+def _prompt_text(prompt, context):
+    return f"{prompt['system_instruction']}\n\n{prompt['template'].format(**context)}"
+
+def _plan_ai_calls(job_info, lang, my_profile, prompts, plan):
+    """Adds the AI calls for one language of a job to the plan."""
+    _plan_summary_and_letter(job_info, my_profile, prompts, plan)
+    _plan_experience_blocks(job_info, lang, my_profile, prompts, plan)
+
+def _plan_summary_and_letter(job_info, my_profile, prompts, plan):
+    summary_context = logic.build_summary_context(my_profile, job_info)
+    plan["ai_calls"].append(("profile_summary", metrics.estimate_tokens(_prompt_text(prompts["profile_summary"], summary_context)),
+                             metrics.estimate_tokens(summary_context["summary_example"])))
+
+    for tag, content in logic.COVER_LETTER_PARAGRAPH_PATTERN.findall(my_profile):
+        tag = tag.strip().lower()
+        if not tag.startswith("ai:"):
+            continue
+        ai_type = tag.split(":")[1].strip()
+        prompt_key = f"cover_letter_{ai_type}"
+        if prompt_key in prompts:
+            context = logic.build_paragraph_context(my_profile, job_info, ai_type, content.strip())
+            plan["ai_calls"].append((prompt_key, metrics.estimate_tokens(_prompt_text(prompts[prompt_key], context)), metrics.estimate_tokens(content)))
+
+def _plan_experience_blocks(job_info, lang, my_profile, prompts, plan, placeholders=None):
+    """Adds the experience block rewrites to the plan, or only those of the given placeholders."""
+    for placeholder, items in logic.parse_experience_from_profile(my_profile).items():
+        if not items or (placeholders is not None and placeholder not in placeholders): continue
+        base_experience_description = "\n".join(items)
+        block_key = semantic_cache.make_block_key(placeholder, base_experience_description, prompts["experience_block"], my_profile, lang)
+        if semantic_cache.would_reuse(block_key, job_info["JobDescription"]):
+            plan["reused_blocks"] += 1
+            continue
+        context = logic.build_experience_context(my_profile, job_info, base_experience_description)
+        plan["ai_calls"].append(("experience_block", metrics.estimate_tokens(_prompt_text(prompts["experience_block"], context)),
+                                 metrics.estimate_tokens(base_experience_description)))
+
+def plan_job(job_info):
+    """
+    Works out the AI calls and compiles a job would need, without calling the API or the compiler.
+    Returns a dict with the planned 'ai_calls' [(prompt_key, input_tokens, output_tokens)],
+    'reused_blocks', 'compiles' and 'pandoc_runs', or None if the job's files cannot be loaded.
+    """
+    variants = logic.get_variants(job_info)
+    languages = list(dict.fromkeys(lang for lang, _ in variants))
+    plan = {"lang": "+".join(languages), "ai_calls": [], "reused_blocks": 0, "compiles": 0, "pandoc_runs": 0}
+
+    for lang in languages:
+        my_profile, prompts, _ = logic.load_language_resources(lang)
+        if not my_profile or not prompts:
+            return None
+        language_job = {**job_info, "Language": lang}
+        journal = checkpoint.JobJournal(language_job)
+        ai_outputs = journal.get(checkpoint.STAGE_AI_GENERATION)
+        # A changed profile or prompt file makes every stage run again.
+        stale = ai_outputs is not None and ai_outputs.get("inputs") != checkpoint.hash_inputs(my_profile, prompts)
+        if ai_outputs is None or stale:
+            _plan_ai_calls(language_job, lang, my_profile, prompts, plan)
+        elif ai_outputs.get("missing_experience_blocks"):
+            _plan_experience_blocks(language_job, lang, my_profile, prompts, plan, ai_outputs["missing_experience_blocks"])
+        if stale or journal.get(checkpoint.STAGE_COVER_LETTER_COMPILE) is None:
+            plan["pandoc_runs"] += 1
+        for variant_lang, cv_source_dir in variants:
+            if variant_lang != lang:
+                continue
+            variant_name = logic.get_variant_name(lang, cv_source_dir)
+            variant_journal = checkpoint.JobJournal(language_job, variant_name) if variant_name else journal
+            if stale or variant_journal.get(checkpoint.STAGE_CV_COMPILE) is None:
+                plan["compiles"] += 1
+    return plan
+
+def _stage_latency(history, stage, default_key):
+    entry = history.get(stage)
+    if entry and entry.get("count"):
+        return entry["mean"]
+    return config.PLAN_DEFAULT_LATENCIES[default_key]
+
+def print_plan(jobs):
+    """Prints the projected AI calls, tokens, cost, compiles and wall time for a batch of jobs."""
+    history = metrics.load_latency_history()
+    compile_latency = _stage_latency(history, "compile", "compile")
+    pandoc_latency = _stage_latency(history, "pandoc", "pandoc")
+    totals = {"calls": 0, "failed_calls": 0, "input_tokens": 0, "output_tokens": 0, "ai_seconds": 0.0}
+    compiles = pandoc_runs = reused_blocks = skipped = 0
+    job_seconds = []
+
+    print(f"\nPlanning {len(jobs)} pending job applications (no API calls or compiles are made)...")
+    print("-" * 40)
+    for job_info in jobs:
+        plan = plan_job(job_info)
+        if plan is None:
+            skipped += 1
+            continue
+        ai_seconds = sum(_stage_latency(history, f"ai:{prompt_key}", "ai") for prompt_key, _, _ in plan["ai_calls"])
+        input_tokens = sum(tokens for _, tokens, _ in plan["ai_calls"])
+        output_tokens = sum(tokens for _, _, tokens in plan["ai_calls"])
+        seconds = ai_seconds + plan["compiles"] * compile_latency + plan["pandoc_runs"] * pandoc_latency
+        print(f"{job_info.get('JobTitle')} at {job_info.get('CompanyName')} [{plan['lang']}]: "
+              f"{len(plan['ai_calls'])} AI calls (~{input_tokens} input / ~{output_tokens} output tokens), "
+              f"{plan['reused_blocks']} reused blocks, {plan['compiles']} CV compiles, {plan['pandoc_runs']} cover letters, ~{seconds:.0f}s")
+
+        totals["calls"] += len(plan["ai_calls"])
+        totals["input_tokens"] += input_tokens
+        totals["output_tokens"] += output_tokens
+        totals["ai_seconds"] += ai_seconds
+        compiles += plan["compiles"]
+        pandoc_runs += plan["pandoc_runs"]
+        reused_blocks += plan["reused_blocks"]
+        job_seconds.append(seconds)
+
+    print("-" * 40)
+    if skipped:
+        print(f"Skipped {skipped} jobs whose profile or prompt files could not be loaded.")
+    if not job_seconds:
+        return
+
+    # The batch is limited by whichever resource is busiest: the AI budget, the CPU budget or the job workers.
+    ai_wall = totals["ai_seconds"] / config.AI_MAX_CONCURRENT_REQUESTS
+    if config.AI_REQUESTS_PER_MINUTE:
+        ai_wall = max(ai_wall, totals["calls"] * 60.0 / config.AI_REQUESTS_PER_MINUTE)
+    cpu_wall = (compiles * compile_latency + pandoc_runs * pandoc_latency) / config.COMPILE_WORKERS
+    sequential = sum(job_seconds)
+    projected = max(ai_wall, cpu_wall, sequential / config.MAX_PARALLEL_JOBS, max(job_seconds))
+
+    print(f"AI calls: {totals['calls']} (~{totals['input_tokens']} input / ~{totals['output_tokens']} output tokens, "
+          f"~${metrics.estimate_cost(totals):.4f}), {reused_blocks} experience blocks reused.")
+    print(f"Compiles: {compiles} CVs with {config.LATEX_COMPILER}, {pandoc_runs} cover letters with pandoc.")
+    print(f"Projected wall time: ~{metrics.format_duration(projected)} with {config.MAX_PARALLEL_JOBS} parallel jobs "
+          f"(~{metrics.format_duration(sequential)} one job at a time).")
+    print(f"  AI budget: ~{metrics.format_duration(ai_wall)} busy, CPU budget: ~{metrics.format_duration(cpu_wall)} busy.")
+    if not history:
+        print("Note: No measured stage latencies yet, so the defaults from config.PLAN_DEFAULT_LATENCIES were used.")
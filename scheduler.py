@@ -0,0 +1,161 @@
+import contextlib
+import datetime
+import threading
+import time
+import config
+import metrics
+
+DEADLINE_FORMATS = ("%Y-%m-%d", "%d.%m.%Y")
+
+class ResourceBudget:
+    """
+    Limits how many stages may use a resource at once and, optionally, how often per minute.
+    Records how long stages had to wait for it.
+    """
+
+    def __init__(self, name, max_concurrent, per_minute=None):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.per_minute = per_minute
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._next_start = 0.0
+        self.acquisitions = 0
+        self.total_wait = 0.0
+
+    @contextlib.contextmanager
+    def slot(self):
+        """Holds one unit of the resource for the duration of the block."""
+        start = time.monotonic()
+        self._slots.acquire()
+        try:
+            if self.per_minute:
+                with self._lock:
+                    begin = max(time.monotonic(), self._next_start)
+                    self._next_start = begin + 60.0 / self.per_minute
+                time.sleep(max(0.0, begin - time.monotonic()))
+            waited = time.monotonic() - start
+            with self._lock:
+                self.acquisitions += 1
+                self.total_wait += waited
+            metrics.record_wait(self.name, waited)
+            yield
+        finally:
+            self._slots.release()
+
+AI_BUDGET = ResourceBudget("ai", config.AI_MAX_CONCURRENT_REQUESTS, config.AI_REQUESTS_PER_MINUTE)
+CPU_BUDGET = ResourceBudget("cpu", config.COMPILE_WORKERS)
+
+_stats_lock = threading.Lock()
+_stats = {"jobs": 0, "max_queue_depth": 0, "total_queue_wait": 0.0, "max_queue_wait": 0.0}
+
+def _parse_deadline(value):
+    for date_format in DEADLINE_FORMATS:
+        try:
+            return datetime.datetime.strptime(value.strip(), date_format).date()
+        except (ValueError, AttributeError):
+            continue
+    return datetime.date.max
+
+def _parse_priority(value):
+    try:
+        return int(str(value).strip())
+    except ValueError:
+        return float("inf")
+
+def job_sort_key(job_info):
+    """Sort key for a job: priority first, then the earliest deadline. Missing values sort last."""
+    return (_parse_priority(job_info.get("Priority", "")), _parse_deadline(job_info.get("Deadline", "")))
+
+def order_jobs(jobs):
+    """Returns the jobs in the order they should run. Ties keep their CSV order."""
+    return sorted(jobs, key=job_sort_key)
+
+def run_jobs(jobs, run_job, on_start=None, on_finish=None, exclusive_key=None):
+    """
+    Runs jobs in priority order on up to config.MAX_PARALLEL_JOBS workers.
+    Jobs with the same exclusive_key(job_info), e.g. the same application folder, never run at the same time.
+    run_job(job_info) returning None stops the batch: no further jobs are started.
+    on_start(index, job_info) and on_finish(job_info, result) are called around every job.
+    Returns False if the batch was stopped early.
+    """
+    enqueued_at = time.monotonic()
+    queue = sorted(((job_sort_key(job_info), index, job_info) for index, job_info in enumerate(jobs)), key=lambda item: item[:2])
+    queue_changed = threading.Condition()
+    running_keys = set()
+    stop = threading.Event()
+    started = [0]
+
+    def next_job():
+        """Takes the highest-priority job that does not conflict with a running one. Returns None when done."""
+        with queue_changed:
+            while queue and not stop.is_set():
+                for position, (_, _, job_info) in enumerate(queue):
+                    key = exclusive_key(job_info) if exclusive_key else None
+                    if key is None or key not in running_keys:
+                        del queue[position]
+                        if key is not None:
+                            running_keys.add(key)
+                        index = started[0]
+                        started[0] += 1
+                        return index, job_info, key, len(queue)
+                queue_changed.wait()
+            return None
+
+    def worker():
+        while True:
+            picked = next_job()
+            if picked is None:
+                return
+            position, job_info, key, depth = picked
+            waited = time.monotonic() - enqueued_at
+            with _stats_lock:
+                _stats["jobs"] += 1
+                _stats["max_queue_depth"] = max(_stats["max_queue_depth"], depth + 1)
+                _stats["total_queue_wait"] += waited
+                _stats["max_queue_wait"] = max(_stats["max_queue_wait"], waited)
+            metrics.set_gauge("jobautomator_queue_depth", {}, depth)
+            metrics.record_wait("queue", waited)
+            try:
+                if on_start:
+                    on_start(position, job_info)
+                result = run_job(job_info)
+                if on_finish:
+                    on_finish(job_info, result)
+                if result is None:
+                    stop.set()
+            finally:
+                with queue_changed:
+                    running_keys.discard(key)
+                    queue_changed.notify_all()
+
+    worker_count = max(1, min(config.MAX_PARALLEL_JOBS, len(jobs)))
+    if worker_count == 1:
+        worker()
+    else:
+        threads = [threading.Thread(target=worker, name=f"job-worker-{i}") for i in range(worker_count)]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                thread.join()
+        except BaseException:
+            # Ctrl-C only reaches the main thread: let the workers finish their current job and start no new ones.
+            stop.set()
+            with queue_changed:
+                queue_changed.notify_all()
+            raise
+    return not stop.is_set()
+
+def print_stats():
+    """Prints queue depth and the time jobs and stages spent waiting."""
+    with _stats_lock:
+        stats = dict(_stats)
+    if not stats["jobs"]:
+        return
+    print(f"Scheduler: {stats['jobs']} jobs, max queue depth {stats['max_queue_depth']}, "
+          f"average wait in queue {stats['total_queue_wait'] / stats['jobs']:.1f}s (max {stats['max_queue_wait']:.1f}s).")
+    for budget in (AI_BUDGET, CPU_BUDGET):
+        if budget.acquisitions:
+            print(f"  {budget.name} budget ({budget.max_concurrent} slots): {budget.acquisitions} stages, "
+                  f"average wait {budget.total_wait / budget.acquisitions:.2f}s.")
@@ -0,0 +1,117 @@
+import atexit
+import datetime
+import os
+import shutil
+import tempfile
+import threading
+import config
+
+_lock = threading.Lock()
+_run_dirs = {}
+_reservations = {}  # Build directory -> (scratch root, bytes reserved for it)
+RUN_DIR_PREFIX = "jobautomator-run-"
+
+def get_scratch_root():
+    """The directory that holds the build trees of every run, preferring RAM-backed storage."""
+    if config.SCRATCH_ROOT:
+        return config.SCRATCH_ROOT
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return "/dev/shm"
+    return tempfile.gettempdir()
+
+def _directory_size(path):
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, filename)).st_size
+            except OSError:
+                pass
+    return total
+
+def _run_dir(root):
+    """This process's directory under a scratch root. Created on first use and removed on exit."""
+    if root not in _run_dirs:
+        run_dir = os.path.join(root, f"{RUN_DIR_PREFIX}{os.getpid()}")
+        os.makedirs(run_dir, exist_ok=True)
+        _run_dirs[root] = run_dir
+    return _run_dirs[root]
+
+def job_dir(folder_name, source_dir):
+    """
+    Returns the build directory path for a job, which will hold a copy of source_dir.
+    The space is reserved until release() is called, so parallel jobs do not all claim the same free space.
+    Falls back to config.SCRATCH_FALLBACK_DIR when the scratch area would exceed its size limit.
+    """
+    needed = _directory_size(source_dir) * 2  # Room for the auxiliary files and PDF the compiler writes
+    with _lock:
+        root = get_scratch_root()
+        reserved = sum(size for reserved_root, size in _reservations.values() if reserved_root == root)
+        try:
+            # Reserved trees that are already partly written show up in 'used' and are missing from 'free'.
+            used = _directory_size(_run_dir(root))
+            free = shutil.disk_usage(root).free
+        except OSError:
+            used, free = 0, 0
+        if reserved + needed > config.SCRATCH_MAX_BYTES or reserved + needed > free + used:
+            root = config.SCRATCH_FALLBACK_DIR
+        build_dir = os.path.join(_run_dir(root), folder_name)
+        _reservations[build_dir] = (root, needed)
+        return build_dir
+
+def release(build_dir):
+    """Releases the space reserved for a build directory by job_dir()."""
+    with _lock:
+        _reservations.pop(build_dir, None)
+
+def keep_failed_build(build_dir, folder_name):
+    """
+    Copies a failed build tree to config.FAILED_BUILDS_DIR for debugging and removes the original.
+    Only the newest config.FAILED_BUILDS_MAX failed builds are kept. Returns the debug copy's path.
+    """
+    os.makedirs(config.FAILED_BUILDS_DIR, exist_ok=True)
+    timestamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    debug_dir = os.path.join(config.FAILED_BUILDS_DIR, f"{folder_name}_{timestamp}")
+    shutil.rmtree(debug_dir, ignore_errors=True)
+    shutil.copytree(build_dir, debug_dir)
+    shutil.rmtree(build_dir, ignore_errors=True)
+    release(build_dir)
+
+    with _lock:
+        kept = sorted((entry for entry in os.scandir(config.FAILED_BUILDS_DIR) if entry.is_dir()), key=lambda entry: entry.stat().st_mtime)
+        for entry in kept[:-config.FAILED_BUILDS_MAX]:
+            shutil.rmtree(entry.path, ignore_errors=True)
+    return debug_dir
+
+def cleanup_stale_runs():
+    """Removes build directories left behind by runs whose process no longer exists."""
+    for root in {get_scratch_root(), config.SCRATCH_FALLBACK_DIR}:
+        if not os.path.isdir(root):
+            continue
+        for entry in os.scandir(root):
+            if not entry.name.startswith(RUN_DIR_PREFIX):
+                continue
+            try:
+                pid = int(entry.name[len(RUN_DIR_PREFIX):])
+            except ValueError:
+                continue
+            if pid != os.getpid() and not _process_exists(pid):
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+def _process_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # The process exists but belongs to someone else
+    return True
+
+@atexit.register
+def cleanup():
+    """Removes this run's build directories."""
+    with _lock:
+        for run_dir in _run_dirs.values():
+            shutil.rmtree(run_dir, ignore_errors=True)
+        _run_dirs.clear()
+        _reservations.clear()
@@ -0,0 +1,150 @@
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import config
+
+_lock = threading.Lock()
+_entries = None
+_stats = {"lookups": 0, "hits": 0, "similarity_total": 0.0}
+
+def vectorize(text):
+    """
+    Turns a text into a sparse, L2-normalised vector of hashed word unigrams and bigrams.
+    Returns a dict of {bucket: weight}.
+    """
+    words = re.findall(r"\w+", text.lower())
+    grams = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    counts = {}
+    for gram in grams:
+        bucket = int(hashlib.md5(gram.encode('utf-8')).hexdigest()[:8], 16) % config.SEMANTIC_VECTOR_DIMENSIONS
+        counts[bucket] = counts.get(bucket, 0) + 1
+    # Sub-linear term frequency keeps long, repetitive postings from dominating.
+    vector = {bucket: 1 + math.log(count) for bucket, count in counts.items()}
+    norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+    return {bucket: weight / norm for bucket, weight in vector.items()} if norm else {}
+
+def cosine_similarity(vector_a, vector_b):
+    """Cosine similarity of two normalised sparse vectors."""
+    if len(vector_a) > len(vector_b):
+        vector_a, vector_b = vector_b, vector_a
+    return sum(weight * vector_b.get(bucket, 0.0) for bucket, weight in vector_a.items())
+
+def make_block_key(placeholder, base_experience_description, prompt, my_profile, lang):
+    """
+    Identifies everything apart from the job description that goes into a rewrite.
+    Stored blocks are only reused for the same placeholder, base bullets, prompt, profile and language.
+    """
+    parts = [placeholder, base_experience_description, prompt["system_instruction"], prompt["template"], my_profile, lang]
+    return hashlib.sha256("\x00".join(parts).encode('utf-8')).hexdigest()[:24]
+
+def _load():
+    """
+    Loads the store from disk the first time it is needed. Must be called with the lock held.
+    The file holds one JSON line per stored rewrite; it is compacted here if it has grown past the entry limit.
+    """
+    global _entries
+    if _entries is None:
+        _entries = {}
+        line_count = 0
+        if os.path.exists(config.SEMANTIC_CACHE_FILE):
+            try:
+                with open(config.SEMANTIC_CACHE_FILE, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        if not line.strip():
+                            continue
+                        line_count += 1
+                        try:
+                            item = json.loads(line)
+                            item["vector"] = {int(bucket): weight for bucket, weight in item["vector"].items()}
+                        except (ValueError, KeyError, AttributeError):
+                            continue  # e.g. a line cut short by an interrupted run
+                        _entries.setdefault(item.pop("block"), []).append(item)
+            except OSError as e:
+                print(f"Warning: Could not read semantic cache at '{config.SEMANTIC_CACHE_FILE}': {e}")
+        for items in _entries.values():
+            del items[:-config.SEMANTIC_CACHE_MAX_ENTRIES_PER_BLOCK]
+        if line_count > sum(len(items) for items in _entries.values()):
+            try:
+                _compact()
+            except OSError as e:
+                print(f"Warning: Could not compact semantic cache: {e}")
+    return _entries
+
+def _compact():
+    """Rewrites the store with only the entries still kept. Must be called with the lock held."""
+    temp_path = f"{config.SEMANTIC_CACHE_FILE}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        for block_key, items in _entries.items():
+            for item in items:
+                f.write(json.dumps({"block": block_key, **item}) + "\n")
+    os.replace(temp_path, config.SEMANTIC_CACHE_FILE)
+
+def _append(block_key, item):
+    """Appends one rewrite to the store on disk. Must be called with the lock held."""
+    os.makedirs(os.path.dirname(config.SEMANTIC_CACHE_FILE) or ".", exist_ok=True)
+    with open(config.SEMANTIC_CACHE_FILE, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({"block": block_key, **item}) + "\n")
+
+def _find_best(block_key, vector):
+    """Returns (best similarity, best item) among the stored rewrites. Must be called with the lock held."""
+    best_score, best_item = 0.0, None
+    for item in _load().get(block_key, []):
+        score = cosine_similarity(vector, item["vector"])
+        if score > best_score:
+            best_score, best_item = score, item
+    return best_score, best_item
+
+def would_reuse(block_key, job_description):
+    """Returns True if lookup() would reuse a stored rewrite. Does not count towards the hit rate."""
+    if not config.SEMANTIC_CACHE_ENABLED:
+        return False
+    vector = vectorize(job_description)
+    with _lock:
+        best_score, best_item = _find_best(block_key, vector)
+    return best_item is not None and best_score >= config.SEMANTIC_SIMILARITY_THRESHOLD
+
+def lookup(block_key, job_description):
+    """Returns a stored rewrite for a similar job description, or None if nothing is close enough."""
+    if not config.SEMANTIC_CACHE_ENABLED:
+        return None
+    vector = vectorize(job_description)
+    with _lock:
+        best_score, best_item = _find_best(block_key, vector)
+        _stats["lookups"] += 1
+        hit = best_item is not None and best_score >= config.SEMANTIC_SIMILARITY_THRESHOLD
+        if hit:
+            _stats["hits"] += 1
+            _stats["similarity_total"] += best_score
+        hit_rate = _stats["hits"] / _stats["lookups"]
+    if hit:
+        print(f"Reusing stored experience block from '{best_item['job']}' (similarity {best_score:.3f}, hit rate {hit_rate:.0%}).")
+        return best_item["text"]
+    if best_item is not None:
+        print(f"No stored experience block close enough (best similarity {best_score:.3f}, hit rate {hit_rate:.0%}).")
+    return None
+
+def store(block_key, job_description, text, job_label=""):
+    """Stores a freshly generated, validated rewrite under the vector of its job description."""
+    if not config.SEMANTIC_CACHE_ENABLED:
+        return
+    item = {"vector": vectorize(job_description), "text": text, "job": job_label}
+    with _lock:
+        items = _load().setdefault(block_key, [])
+        items.append(item)
+        del items[:-config.SEMANTIC_CACHE_MAX_ENTRIES_PER_BLOCK]
+        try:
+            _append(block_key, item)
+        except OSError as e:
+            print(f"Warning: Could not write semantic cache: {e}")
+
+def print_stats():
+    """Prints the hit rate and average similarity of reused blocks for this run."""
+    with _lock:
+        lookups, hits, similarity_total = _stats["lookups"], _stats["hits"], _stats["similarity_total"]
+    if not config.SEMANTIC_CACHE_ENABLED or not lookups:
+        return
+    average = f", average similarity {similarity_total / hits:.3f}" if hits else ""
+    print(f"Experience block reuse: {hits} of {lookups} blocks reused ({hits / lookups:.0%}{average}).")
@@ -0,0 +1,45 @@
+import os
+import signal
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+import scheduler
+
+class RunJobsInterruptTest(unittest.TestCase):
+
+    def setUp(self):
+        self._max_parallel_jobs = config.MAX_PARALLEL_JOBS
+        config.MAX_PARALLEL_JOBS = 2
+
+    def tearDown(self):
+        config.MAX_PARALLEL_JOBS = self._max_parallel_jobs
+
+    def test_sigint_stops_starting_new_jobs(self):
+        started, finished = [], []
+        lock = threading.Lock()
+
+        def run_job(job_info):
+            with lock:
+                started.append(job_info["id"])
+            time.sleep(0.2)
+            with lock:
+                finished.append(job_info["id"])
+                if len(finished) == 2:
+                    os.kill(os.getpid(), signal.SIGINT)
+            return True
+
+        jobs = [{"id": i} for i in range(8)]
+        with self.assertRaises(KeyboardInterrupt):
+            scheduler.run_jobs(jobs, run_job)
+        time.sleep(0.5)  # Workers finish the job they are on
+        # Two jobs had finished and at most the two jobs in flight may still start afterwards.
+        self.assertLessEqual(len(started), 4)
+        self.assertEqual(sorted(started), sorted(finished))
+
+if __name__ == "__main__":
+    unittest.main()